@@ -0,0 +1,50 @@
+"""Added unique constraints to lesson and problem completions
+
+Revision ID: 8c46ade5c6be
+Revises: d1eec51813ae
+Create Date: 2026-10-18 14:05:47.918305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c46ade5c6be'
+down_revision: Union[str, None] = 'd1eec51813ae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Drop duplicate completions left by the old check-then-insert flow, keeping the earliest one
+    for table, part_column in (
+        ('user_lesson_completion', 'lesson_id'),
+        ('user_problem_completion', 'problem_id'),
+    ):
+        op.execute(f"""
+            DELETE FROM {table}
+            WHERE EXISTS (
+                SELECT 1 FROM {table} earlier
+                WHERE earlier.user_id = {table}.user_id
+                  AND earlier.{part_column} = {table}.{part_column}
+                  AND (earlier.completed_at < {table}.completed_at
+                       OR (earlier.completed_at = {table}.completed_at AND earlier.id < {table}.id))
+            )
+        """)
+
+    with op.batch_alter_table('user_lesson_completion') as batch_op:
+        batch_op.create_unique_constraint('uq_user_lesson_completion', ['user_id', 'lesson_id'])
+    with op.batch_alter_table('user_problem_completion') as batch_op:
+        batch_op.create_unique_constraint('uq_user_problem_completion', ['user_id', 'problem_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('user_problem_completion') as batch_op:
+        batch_op.drop_constraint('uq_user_problem_completion', type_='unique')
+    with op.batch_alter_table('user_lesson_completion') as batch_op:
+        batch_op.drop_constraint('uq_user_lesson_completion', type_='unique')
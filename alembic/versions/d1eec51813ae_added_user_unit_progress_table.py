@@ -0,0 +1,55 @@
+"""Added materialized user unit progress table
+
+Revision ID: d1eec51813ae
+Revises: cd47a9659b2c
+Create Date: 2026-10-18 13:40:12.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1eec51813ae'
+down_revision: Union[str, None] = 'cd47a9659b2c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_unit_progress',
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('unit_id', sa.UUID(), nullable=False),
+    sa.Column('completed_parts', sa.Integer(), nullable=False),
+    sa.Column('total_parts', sa.Integer(), nullable=False),
+    sa.Column('last_updated', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['unit_id'], ['units.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'unit_id')
+    )
+    # Backfill from the completion tables (same counts as helpers/progressHelpers.compute_units_parts)
+    op.execute("""
+        INSERT INTO user_unit_progress (user_id, unit_id, completed_parts, total_parts, last_updated)
+        SELECT done.user_id, done.unit_id,
+               CASE WHEN SUM(done.lessons) > 0 THEN 1 ELSE 0 END + SUM(done.problems),
+               1 + (SELECT COUNT(*) FROM practice_problems p WHERE p.unit_id = done.unit_id),
+               CURRENT_TIMESTAMP
+        FROM (
+            SELECT c.user_id, l.unit_id, COUNT(DISTINCT c.lesson_id) AS lessons, 0 AS problems
+            FROM user_lesson_completion c JOIN lessons l ON l.id = c.lesson_id
+            GROUP BY c.user_id, l.unit_id
+            UNION ALL
+            SELECT c.user_id, p.unit_id, 0, COUNT(DISTINCT c.problem_id)
+            FROM user_problem_completion c JOIN practice_problems p ON p.id = c.problem_id
+            GROUP BY c.user_id, p.unit_id
+        ) done
+        GROUP BY done.user_id, done.unit_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_unit_progress')
@@ -0,0 +1,87 @@
+"""Event loop lag while many chats wait on the inference backend.
+
+Runs N concurrent aiService.get_response calls against a mocked backend that answers
+after a fixed delay, using the configured database and its first users:
+    python -m benchmarks.chat_loop_lag --chats 200 --delay-ms 500
+With nothing blocking the loop, the lag stays within a few ms and the whole run takes
+about one backend delay (more once INFERENCE_MAX_CONNECTIONS is the limit). Chats past a
+user's daily token quota are counted as 429s, spread them over more users to avoid that.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from benchmarks.loop_lag import LoopLagMonitor
+from db.db import AsyncSessionLocal
+from helpers import profanityHelpers
+from models.models import User
+from schemas.schemas import ChatRequest
+from services import aiService, promptLogService
+
+def mock_backend(delay: float):
+    async def handler(request: httpx.Request):
+        await asyncio.sleep(delay)
+        body = json.loads(request.content)
+        return httpx.Response(200, json={
+            "choices": [{"message": {"role": "assistant", "content": "Reply to " + body["messages"][-1]["content"]}}],
+            "usage": {"total_tokens": 50},
+        })
+    return httpx.MockTransport(handler)
+
+async def run(args):
+    aiService.INFERENCE_URL = aiService.INFERENCE_URL or "http://inference.benchmark"
+    aiService.INFERENCE_KEY = aiService.INFERENCE_KEY or "benchmark"
+    aiService.INFERENCE_MODEL_ID = aiService.INFERENCE_MODEL_ID or "benchmark"
+    client = aiService.create_http_client()
+    client._transport = mock_backend(args.delay_ms / 1000)
+    aiService._http_client = client
+    await promptLogService.start()
+    await profanityHelpers.warm_up()
+
+    async with AsyncSessionLocal() as db:
+        users = (await db.execute(select(User).limit(args.users))).scalars().all()
+    if not users:
+        raise SystemExit("No users in the database, seed it first")
+
+    statuses = {}
+
+    async def chat(index):
+        user = users[index % len(users)]
+        req = ChatRequest(user_input=f"What is an edge? ({index})", no_cache=True)
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            try:
+                await aiService.get_response(req, db, user)
+                status_code = 200
+            except HTTPException as e:
+                status_code = e.status_code
+            statuses[status_code] = statuses.get(status_code, 0) + 1
+            return time.perf_counter() - started
+
+    try:
+        async with LoopLagMonitor() as monitor:
+            started = time.perf_counter()
+            latencies = sorted(await asyncio.gather(*[chat(i) for i in range(args.chats)]))
+            elapsed = time.perf_counter() - started
+    finally:
+        await promptLogService.stop()
+        await aiService.close_http_client()
+        profanityHelpers.shutdown()
+
+    print(f"{args.chats} chats over {len(users)} users, backend delay {args.delay_ms:.0f} ms")
+    print(f"statuses: {statuses}")
+    print(f"total {elapsed * 1000:.0f} ms, {args.chats / elapsed:.1f} chats/sec")
+    print(f"latency: p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+    print(monitor.summary())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--delay-ms", type=float, default=500)
+    parser.add_argument("--users", type=int, default=10)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,58 @@
+"""Logins per second per core, and how much the event loop lags meanwhile.
+
+Runs the app in-process against the configured database, logging in as a seeded user:
+    python -m benchmarks.login_throughput --requests 200 --concurrency 32
+All logins come from one client, so raise RATE_LIMIT_AUTH (e.g. 100000/60) first. Logins
+beyond HASH_POOL_SIZE + HASH_QUEUE_LIMIT get a 503, raise HASH_QUEUE_LIMIT to measure
+throughput alone.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+import main
+from benchmarks.loop_lag import LoopLagMonitor
+from helpers import authHelpers
+
+async def run(args):
+    transport = httpx.ASGITransport(app=main.app)
+    body = {"email": args.email, "password": args.password}
+    statuses = {}
+    latencies = []
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        async def login():
+            async with slots:
+                started = time.perf_counter()
+                response = await client.post("/auth/login", json=body)
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        await login()  # warm up the connection pool
+        statuses.clear()
+        latencies.clear()
+        async with LoopLagMonitor() as monitor:
+            started = time.perf_counter()
+            await asyncio.gather(*[login() for _ in range(args.requests)])
+            elapsed = time.perf_counter() - started
+
+    ok = statuses.get(200, 0)
+    cores = min(authHelpers.HASH_POOL_SIZE, os.cpu_count() or 1)
+    latencies.sort()
+    print(f"{args.requests} logins, concurrency {args.concurrency}, bcrypt rounds {authHelpers.BCRYPT_ROUNDS}, hash pool {authHelpers.HASH_POOL_SIZE}")
+    print(f"statuses: {statuses}")
+    print(f"{ok / elapsed:.1f} logins/sec, {ok / elapsed / cores:.1f} logins/sec/core")
+    print(f"latency: p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+    print(monitor.summary())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--email", default="user1@user1.com")
+    parser.add_argument("--password", default="password123")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+class LoopLagMonitor:
+    """Ticks every interval_ms while running and records how late each tick woke up.
+
+    Anything blocking the event loop shows up as lag, so it should stay within a few ms.
+    """
+
+    def __init__(self, interval_ms: float = 5):
+        self.interval = interval_ms / 1000
+        self.lags = []
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._tick())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _tick(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.perf_counter() - started - self.interval)
+
+    def summary(self):
+        if not self.lags:
+            return "no ticks"
+        lags = sorted(self.lags)
+        p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+        return f"event loop lag: max {lags[-1] * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms over {len(lags)} ticks"
@@ -0,0 +1,46 @@
+"""Event loop lag while profanity checks are classified.
+
+Replaces the classifier with one that blocks for a fixed time, as sklearn does, then runs
+N concurrent is_profane calls next to the loop lag monitor:
+    python -m benchmarks.profanity_loop_lag --checks 30 --delay-ms 50
+Checks arriving together should be classified in one batch (up to PROFANITY_MAX_BATCH)
+while the lag stays under 5 ms, since predict runs off the event loop.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.loop_lag import LoopLagMonitor
+from helpers import profanityHelpers
+
+def fixed_delay_predict(delay: float):
+    def predict(texts):
+        time.sleep(delay)
+        return [1 if "damn" in text else 0 for text in texts]
+    return predict
+
+async def run(args):
+    profanityHelpers.predict = fixed_delay_predict(args.delay_ms / 1000)
+    await profanityHelpers.warm_up()
+    before = profanityHelpers.profanity_stats()
+    try:
+        async with LoopLagMonitor() as monitor:
+            started = time.perf_counter()
+            results = await asyncio.gather(*[
+                profanityHelpers.is_profane("damn" if i % 3 == 0 else "hello") for i in range(args.checks)
+            ])
+            elapsed = time.perf_counter() - started
+    finally:
+        profanityHelpers.shutdown()
+
+    stats = profanityHelpers.profanity_stats()
+    batches = stats["batches"] - before["batches"]
+    print(f"{args.checks} checks, classifier delay {args.delay_ms:.0f} ms, {sum(results)} profane")
+    print(f"{batches} batches, avg {(stats['classified'] - before['classified']) / batches:.1f} checks per batch, total {elapsed * 1000:.0f} ms")
+    print(monitor.summary())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--checks", type=int, default=30)
+    parser.add_argument("--delay-ms", type=float, default=50)
+    asyncio.run(run(parser.parse_args()))
@@ -6,9 +6,16 @@ import os
 from jwt import ExpiredSignatureError, InvalidTokenError
 from fastapi import Depends, HTTPException, status, Request, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.models import User
-from db.db import get_db
+from db.db import get_async_db
+from helpers.cacheHelpers import LRUCache
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import threading
+import time
 
 bearer_scheme = HTTPBearer(auto_error=False)
 
@@ -18,17 +25,67 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES") or 30)
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE") or 1024)
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS") or 60)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE") or 4096)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS") or 12)
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE") or os.cpu_count() or 1)
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT") or 2 * HASH_POOL_SIZE)
 
 if not SECRET_KEY or not ALGORITHM:
     raise RuntimeError("Missing SECRET_KEY or ALGORITHM environment variables")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt runs on its own small pool instead of the request threadpool, and at most
+# HASH_POOL_SIZE + HASH_QUEUE_LIMIT hashes can be running or waiting at once. Beyond
+# that, login/register fail fast with a 503 instead of queueing without bound.
+# The routes await the hash, so no event loop or request thread waits on bcrypt.
+_hash_pool = ThreadPoolExecutor(max_workers=HASH_POOL_SIZE, thread_name_prefix="password-hash")
+_hash_slots = threading.BoundedSemaphore(HASH_POOL_SIZE + HASH_QUEUE_LIMIT)
+
+def _submit_hashing(fn, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        future = _hash_pool.submit(fn, *args)
+    except BaseException:
+        _hash_slots.release()
+        raise
+    # Released when the hash finishes, even if the request awaiting it is cancelled first
+    future.add_done_callback(lambda _: _hash_slots.release())
+    return future
+
+def _run_hashing(fn, *args):
+    return _submit_hashing(fn, *args).result()
+
+async def _run_hashing_async(fn, *args):
+    return await asyncio.wrap_future(_submit_hashing(fn, *args))
+
+# Decoded token payloads keyed by token hash, each kept until the token's exp
+token_cache = LRUCache(TOKEN_CACHE_SIZE)
+# Detached User snapshots keyed by user id, so authenticated requests skip the users SELECT.
+# Anything that changes a user must update the snapshot or call invalidate_principal.
+principal_cache = LRUCache(PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+def invalidate_principal(user_id):
+    principal_cache.pop(str(user_id))
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return _run_hashing(pwd_context.verify, plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _run_hashing(pwd_context.hash, password)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_hashing_async(pwd_context.verify, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_hashing_async(pwd_context.hash, password)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -38,14 +95,20 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 def verify_token(token: str):
+    token_key = hashlib.sha256(token.encode()).hexdigest()
+    payload = token_cache.get(token_key)
+    if payload is not None:
+        return dict(payload)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except ExpiredSignatureError:
         print("Token has expired")
         return None
     except InvalidTokenError:
         return None
+    if "exp" in payload:
+        token_cache.set(token_key, payload, ttl=payload["exp"] - time.time())
+    return dict(payload)
     
 # New function to extract token from request
 def extract_token_from_request(request: Request):
@@ -60,7 +123,7 @@ def extract_token_from_request(request: Request):
     
     return token
     
-def get_current_user(request: Request, db: Session = Depends(get_db)):
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_async_db)):
     token = extract_token_from_request(request)
     
     if not token:
@@ -70,7 +133,8 @@ def get_current_user(request: Request, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
         
-    user_id = verify_token(token).get("id")
+    payload = verify_token(token)
+    user_id = payload.get("id") if payload else None
     if not user_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -78,7 +142,12 @@ def get_current_user(request: Request, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
         
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user = principal_cache.get(user_id)
+    if user is None:
+        user = (await db.execute(select(User).where(User.id == user_id))).scalars().first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        # Detach it so the snapshot can be shared between requests
+        db.expunge(user)
+        principal_cache.set(user_id, user)
     return user
\ No newline at end of file
@@ -0,0 +1,187 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+import hashlib
+import json
+import os
+import threading
+import time
+
+load_dotenv()
+
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE") or 512)
+# Content written by another process (python seed.py) only shows up once entries expire
+CATALOG_CACHE_TTL_SECONDS = int(os.getenv("CATALOG_CACHE_TTL_SECONDS") or 300)
+DASHBOARD_CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE") or 1024)  # users
+DASHBOARD_CACHE_TTL_SECONDS = int(os.getenv("DASHBOARD_CACHE_TTL_SECONDS") or 300)
+LEARNING_CONTEXT_CACHE_SIZE = int(os.getenv("LEARNING_CONTEXT_CACHE_SIZE") or 4096)  # users
+LEARNING_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("LEARNING_CONTEXT_CACHE_TTL_SECONDS") or 600)
+
+_MISSING = object()
+
+class LRUCache:
+    """Thread-safe LRU cache with hit/miss counters and optional expiry (in seconds)."""
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl: float = None):
+        # ttl overrides the cache-wide ttl for this entry
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[1] if entry is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+@dataclass(frozen=True)
+class CachedPayload:
+    """A response body encoded once, with the strong ETag of its content."""
+    body: bytes
+    etag: str
+
+    @classmethod
+    def encode(cls, value):
+        body = json.dumps(
+            jsonable_encoder(value), ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        return cls(body=body, etag=f'"{hashlib.sha256(body).hexdigest()}"')
+
+def etag_matches(if_none_match: str, etag: str):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+def payload_response(request: Request, payload: CachedPayload):
+    """Send an encoded payload, or 304 when the client's ETag is current."""
+    headers = {"ETag": payload.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), payload.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload.body, media_type="application/json", headers=headers)
+
+# --- Catalog cache ---
+# Courses, units, lessons, practice problems and skills are keyed by the global content
+# version. Any content write in this process bumps the version, so stale entries are
+# never read again and simply age out of the LRU. Writes from other processes, like
+# the seed script, can't bump it: the TTL bounds how long those go unnoticed. Entries
+# are stored already encoded with their ETag, so hits skip both the database and
+# response serialization.
+catalog_cache = LRUCache(CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL_SECONDS)
+
+_content_version = 0
+_content_version_lock = threading.Lock()
+
+def content_version():
+    return _content_version
+
+def bump_content_version():
+    global _content_version
+    with _content_version_lock:
+        _content_version += 1
+    return _content_version
+
+def cached_catalog(entity: str, key, loader):
+    # Read the version before loading so a write racing with the load can't
+    # leave stale data under the new version
+    cache_key = (content_version(), entity, key)
+    payload = catalog_cache.get(cache_key, _MISSING)
+    if payload is _MISSING:
+        payload = CachedPayload.encode(loader())
+        catalog_cache.set(cache_key, payload)
+    return payload
+
+def catalog_response(request: Request, entity: str, key, loader):
+    """Serve a catalog read from the cache, answering 304 when the client's ETag is current."""
+    return payload_response(request, cached_catalog(entity, key, loader))
+
+# --- Per-user dashboard cache ---
+# One LRU entry per user holding that user's course dashboards. Completions drop the
+# whole entry and bump the user's generation; content writes are caught by the content
+# version. Both are stored with each payload, read before it was loaded, so a load that
+# raced with a write is never served.
+dashboard_cache = LRUCache(DASHBOARD_CACHE_SIZE, ttl=DASHBOARD_CACHE_TTL_SECONDS)
+
+_dashboard_generations = {}  # user -> number of invalidations
+_dashboard_generations_lock = threading.Lock()
+
+def _user_key(user_id):
+    return str(user_id).lower()
+
+def invalidate_user_dashboards(user_id):
+    with _dashboard_generations_lock:
+        _dashboard_generations[_user_key(user_id)] = _dashboard_generations.get(_user_key(user_id), 0) + 1
+    dashboard_cache.pop(_user_key(user_id))
+
+def user_dashboard_response(request: Request, user_id, course_id, loader):
+    version = (content_version(), _dashboard_generations.get(_user_key(user_id), 0))
+    dashboards = dashboard_cache.get(_user_key(user_id))
+    cached = dashboards.get(str(course_id)) if dashboards is not None else None
+    if cached is not None and cached[0] == version:
+        payload = cached[1]
+    else:
+        payload = CachedPayload.encode(loader())
+        if dashboards is None:
+            dashboards = {}
+            dashboard_cache.set(_user_key(user_id), dashboards)
+        dashboards[str(course_id)] = (version, payload)
+    return payload_response(request, payload)
+
+# --- Learning context ---
+# A user's learning levels and the system prompt sentence rendered from them, used by
+# every AI chat. Dropped once skill gains for the user are committed (see the
+# completion routes and completionService); the TTL bounds staleness from other processes.
+learning_context_cache = LRUCache(LEARNING_CONTEXT_CACHE_SIZE, ttl=LEARNING_CONTEXT_CACHE_TTL_SECONDS)
+
+def invalidate_learning_context(user_id):
+    learning_context_cache.pop(_user_key(user_id))
+
+def cached_learning_context(user_id):
+    return learning_context_cache.get(_user_key(user_id))
+
+def cache_learning_context(user_id, context):
+    learning_context_cache.set(_user_key(user_id), context)
@@ -0,0 +1,38 @@
+from models.models import Course, Unit, Lesson, PracticeProblem
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+# Loader options for the Course -> Unit -> Lesson / PracticeProblem tree.
+# A unit has a single lesson so it is joined into the units query, practice problems
+# are one-to-many so they get their own IN query. A full course tree always costs
+# 3 queries (courses, units + lessons, problems) no matter how many units there are.
+
+def unit_tree_options():
+    return (
+        joinedload(Unit.lesson),
+        selectinload(Unit.practice_problems),
+    )
+
+def course_tree_options():
+    units = selectinload(Course.units)
+    return (
+        units.joinedload(Unit.lesson),
+        units.selectinload(Unit.practice_problems),
+    )
+
+# Summary trees (schemas.CourseSummaryOut) never select the large text columns
+# (Lesson.content, PracticeProblem.question and PracticeProblem.data)
+def course_summary_options():
+    units = selectinload(Course.units)
+    return (
+        units.joinedload(Unit.lesson).load_only(Lesson.id, Lesson.title, Lesson.unit_id),
+        units.selectinload(Unit.practice_problems).load_only(
+            PracticeProblem.id, PracticeProblem.type, PracticeProblem.unit_id
+        ),
+    )
+
+def query_course_tree(db: Session, summary: bool = False):
+    options = course_summary_options() if summary else course_tree_options()
+    return db.query(Course).options(*options)
+
+def query_unit_tree(db: Session):
+    return db.query(Unit).options(*unit_tree_options())
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from profanity_check import predict
+import asyncio
+import os
+
+load_dotenv()
+
+# Inputs arriving within the window are classified together in one predict call
+PROFANITY_BATCH_WINDOW_MS = float(os.getenv("PROFANITY_BATCH_WINDOW_MS") or 5)
+PROFANITY_MAX_BATCH = int(os.getenv("PROFANITY_MAX_BATCH") or 64)
+PROFANITY_WORKERS = int(os.getenv("PROFANITY_WORKERS") or 1)
+
+# sklearn work runs here instead of on the event loop
+_executor: ThreadPoolExecutor = None
+_pending = []  # (text, future) waiting for the next batch
+_flush_handle = None
+_batches = 0
+_classified = 0
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PROFANITY_WORKERS, thread_name_prefix="profanity")
+    return _executor
+
+async def warm_up():
+    """Run one prediction at startup so the first chat doesn't pay for loading the model."""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_get_executor(), predict, ["warm up"])
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def profanity_stats():
+    return {
+        "batches": _batches,
+        "classified": _classified,
+        "avg_batch_size": _classified / _batches if _batches else 0.0,
+        "pending": len(_pending),
+    }
+
+async def is_profane(text: str):
+    """Classify text, batched with the other inputs that arrive within PROFANITY_BATCH_WINDOW_MS."""
+    global _flush_handle
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _pending.append((text, future))
+    if len(_pending) >= PROFANITY_MAX_BATCH:
+        _flush()
+    elif _flush_handle is None:
+        _flush_handle = loop.call_later(PROFANITY_BATCH_WINDOW_MS / 1000, _flush)
+    return await future
+
+def _flush():
+    global _pending, _flush_handle
+    if _flush_handle is not None:
+        _flush_handle.cancel()
+        _flush_handle = None
+    batch, _pending = _pending, []
+    if batch:
+        asyncio.get_running_loop().create_task(_classify(batch))
+
+async def _classify(batch):
+    global _batches, _classified
+    loop = asyncio.get_running_loop()
+    try:
+        results = await loop.run_in_executor(_get_executor(), predict, [text for text, _ in batch])
+    except Exception as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+    _batches += 1
+    _classified += len(batch)
+    for (_, future), result in zip(batch, results):
+        if not future.done():
+            future.set_result(result == 1)
@@ -0,0 +1,176 @@
+from models.models import Lesson, PracticeProblem, Unit, UserCourseOrderProgress, UserLessonCompletion, UserProblemCompletion, UserUnitProgress
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from db.db import dialect_insert
+
+def progress_percentage(completed_parts: int, total_parts: int):
+    if total_parts == 0:
+        return 0  # Avoid division by zero if there are no parts in the unit
+    return int((completed_parts / total_parts) * 100)
+
+# --- Materialized progress (user_unit_progress) ---
+
+def unit_total_parts(db: Session, unit_id):
+    # Units always have only one lesson
+    return 1 + db.query(func.count(PracticeProblem.id)).filter(PracticeProblem.unit_id == unit_id).scalar()
+
+def record_unit_part_completed(db: Session, user_id: str, unit_id, parts: int = 1):
+    """
+    Count more completed parts of a unit (one by default), in the caller's transaction.
+
+    A single upsert, so concurrent completions in the same unit can't lose increments.
+    Returns the updated (completed_parts, total_parts) row.
+    """
+    now = datetime.now(timezone.utc)
+    # Units always have only one lesson
+    total_parts = 1 + (
+        select(func.count(PracticeProblem.id))
+        .where(PracticeProblem.unit_id == unit_id)
+        .scalar_subquery()
+    )
+    stmt = dialect_insert(db, UserUnitProgress).values(
+        user_id=user_id,
+        unit_id=unit_id,
+        completed_parts=parts,
+        total_parts=total_parts,
+        last_updated=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserUnitProgress.user_id, UserUnitProgress.unit_id],
+        set_={"completed_parts": UserUnitProgress.completed_parts + parts, "last_updated": now},
+    ).returning(UserUnitProgress.completed_parts, UserUnitProgress.total_parts)
+    return db.execute(stmt).one()
+
+def unit_is_unlocked(db: Session, user_id: str, course_id, unit_order: int):
+    current_order = db.query(UserCourseOrderProgress.current_order).filter(
+        UserCourseOrderProgress.user_id == user_id,
+        UserCourseOrderProgress.course_id == course_id
+    ).scalar()
+    # No progress row yet means only the first unit is open
+    return (current_order or 1) == unit_order
+
+def unlock_next_unit(db: Session, user_id: str, course_id, unit_order: int):
+    """
+    Move the user's course progress past a finished unit, in the caller's transaction.
+
+    The update only applies while current_order is still the finished unit, so
+    concurrent or retried completions can't skip a unit.
+    """
+    now = datetime.now(timezone.utc)
+    stmt = dialect_insert(db, UserCourseOrderProgress).values(
+        user_id=user_id,
+        course_id=course_id,
+        current_order=unit_order + 1,
+        last_updated=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserCourseOrderProgress.user_id, UserCourseOrderProgress.course_id],
+        set_={"current_order": unit_order + 1, "last_updated": now},
+        where=UserCourseOrderProgress.current_order == unit_order,
+    )
+    db.execute(stmt)
+
+def refresh_unit_total_parts(db: Session, unit_id):
+    """Update total_parts for everyone who started a unit, after its problems changed."""
+    db.query(UserUnitProgress).filter(UserUnitProgress.unit_id == unit_id).update(
+        {UserUnitProgress.total_parts: unit_total_parts(db, unit_id)},
+        synchronize_session=False,
+    )
+
+# --- Rebuild & consistency check ---
+
+def compute_units_parts(db: Session, user_id: str = None):
+    """
+    Completed and total parts per (user, unit), computed from the completion tables.
+
+    This is the source of truth user_unit_progress is rebuilt and checked against.
+    Returns a dict of (user_id, unit_id) -> (completed_parts, total_parts).
+    """
+    lessons_done = (
+        db.query(
+            UserLessonCompletion.user_id,
+            Lesson.unit_id,
+            func.count(func.distinct(UserLessonCompletion.lesson_id)),
+        )
+        .join(Lesson, Lesson.id == UserLessonCompletion.lesson_id)
+        .group_by(UserLessonCompletion.user_id, Lesson.unit_id)
+    )
+    problems_done = (
+        db.query(
+            UserProblemCompletion.user_id,
+            PracticeProblem.unit_id,
+            func.count(func.distinct(UserProblemCompletion.problem_id)),
+        )
+        .join(PracticeProblem, PracticeProblem.id == UserProblemCompletion.problem_id)
+        .group_by(UserProblemCompletion.user_id, PracticeProblem.unit_id)
+    )
+    if user_id is not None:
+        lessons_done = lessons_done.filter(UserLessonCompletion.user_id == user_id)
+        problems_done = problems_done.filter(UserProblemCompletion.user_id == user_id)
+
+    completed = {}
+    for row_user_id, unit_id, done in lessons_done.all():
+        completed[(row_user_id, unit_id)] = min(done, 1)
+    for row_user_id, unit_id, done in problems_done.all():
+        completed[(row_user_id, unit_id)] = completed.get((row_user_id, unit_id), 0) + done
+
+    problems_total = dict(
+        db.query(Unit.id, func.count(PracticeProblem.id))
+        .outerjoin(PracticeProblem, PracticeProblem.unit_id == Unit.id)
+        .group_by(Unit.id)
+        .all()
+    )
+    return {
+        key: (done, 1 + problems_total.get(key[1], 0))
+        for key, done in completed.items()
+    }
+
+def rebuild_user_unit_progress(db: Session, user_id: str = None):
+    """Recompute user_unit_progress from the completion tables, for one user or everyone."""
+    expected = compute_units_parts(db, user_id)
+    stale = db.query(UserUnitProgress)
+    if user_id is not None:
+        stale = stale.filter(UserUnitProgress.user_id == user_id)
+    stale.delete(synchronize_session=False)
+
+    now = datetime.now(timezone.utc)
+    db.add_all(
+        UserUnitProgress(
+            user_id=row_user_id,
+            unit_id=unit_id,
+            completed_parts=completed_parts,
+            total_parts=total_parts,
+            last_updated=now,
+        )
+        for (row_user_id, unit_id), (completed_parts, total_parts) in expected.items()
+    )
+    db.commit()
+    return len(expected)
+
+def check_user_unit_progress(db: Session, user_id: str = None):
+    """
+    Compare user_unit_progress against the completion tables.
+
+    Returns a list of mismatches, each a dict with the stored and expected
+    (completed_parts, total_parts), None meaning there is no row.
+    """
+    expected = compute_units_parts(db, user_id)
+    stored_query = db.query(UserUnitProgress)
+    if user_id is not None:
+        stored_query = stored_query.filter(UserUnitProgress.user_id == user_id)
+    stored = {
+        (row.user_id, row.unit_id): (row.completed_parts, row.total_parts)
+        for row in stored_query.all()
+    }
+
+    mismatches = []
+    for key in expected.keys() | stored.keys():
+        if expected.get(key) != stored.get(key):
+            mismatches.append({
+                "user_id": key[0],
+                "unit_id": key[1],
+                "stored": stored.get(key),
+                "expected": expected.get(key),
+            })
+    return mismatches
@@ -1,25 +1,110 @@
-from models.models import Skill, User, user_skills
+from models.models import Skill, User, user_skills, lesson_skills, problem_skills
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, func, literal, select, and_, true
 from typing import List
+from db.db import dialect_insert
+import uuid
 
-def get_user_learning_levels(user_id: str, db: Session, skills_whitelist: List[Skill] = None):
-    # Query all skills and the user's learning level for each
-    if skills_whitelist is None:
-        skills_whitelist = db.query(Skill).all()
-          # Fetch all skills if no whitelist provided
-    whitelist_skill_ids = [skill.id for skill in skills_whitelist]
-    
-    results = (
-        db.query(Skill.name, user_skills.c.learning_level)
+def learning_levels_query(user_id: str, whitelist_skill_ids: list = None):
+    query = (
+        select(Skill.name, user_skills.c.learning_level)
         .join(user_skills, Skill.id == user_skills.c.skill_id)
-        .filter(user_skills.c.user_id == user_id)
-        .filter(Skill.id.in_(whitelist_skill_ids))
-        .all()
+        .where(user_skills.c.user_id == user_id)
     )
+    # No whitelist means every skill, which the join already gives
+    if whitelist_skill_ids is not None:
+        query = query.where(Skill.id.in_(whitelist_skill_ids))
+    return query
 
-    learning_levels = {row[0]: float(row[1]) if row[1] is not None else 0.0 for row in results}
+def learning_levels_out(rows):
+    learning_levels = {row[0]: float(row[1]) if row[1] is not None else 0.0 for row in rows}
 
     return {
         "Learning Levels": learning_levels,
-    }
\ No newline at end of file
+    }
+
+def get_user_learning_levels(user_id: str, db: Session, skills_whitelist: List[Skill] = None):
+    # The user's learning level for each skill (of the whitelist, if given)
+    whitelist_skill_ids = [skill.id for skill in skills_whitelist] if skills_whitelist is not None else None
+
+    results = db.execute(learning_levels_query(user_id, whitelist_skill_ids)).all()
+    return learning_levels_out(results)
+
+async def get_user_learning_levels_async(user_id: str, db: AsyncSession, skills_whitelist: List[Skill] = None):
+    """get_user_learning_levels on an AsyncSession."""
+    whitelist_skill_ids = [skill.id for skill in skills_whitelist] if skills_whitelist is not None else None
+
+    results = (await db.execute(learning_levels_query(user_id, whitelist_skill_ids))).all()
+    return learning_levels_out(results)
+
+def query_user_skills(db: Session, user_id: str, include_zero: bool = False):
+    """
+    A user's skills with their learning levels, in a single query.
+
+    The query starts from users, so an unknown user (no rows) is told apart from a user
+    without skills (one row with NULL skill columns). With include_zero every skill is
+    listed, with 0.0 for the ones the user hasn't started.
+    """
+    query = (
+        db.query(
+            User.id.label("user_id"),
+            Skill.id.label("skill_id"),
+            Skill.name,
+            Skill.description,
+            func.coalesce(user_skills.c.learning_level, 0.0).label("learning_level"),
+        )
+        .select_from(User)
+        .filter(User.id == user_id)
+    )
+    if include_zero:
+        return query.outerjoin(Skill, true()).outerjoin(
+            user_skills,
+            and_(user_skills.c.user_id == User.id, user_skills.c.skill_id == Skill.id)
+        )
+    return query.outerjoin(user_skills, user_skills.c.user_id == User.id).outerjoin(
+        Skill, Skill.id == user_skills.c.skill_id
+    )
+
+def user_skills_out(rows):
+    return [
+        {
+            "id": row.skill_id,
+            "name": row.name,
+            "description": row.description,
+            "learning_level": row.learning_level
+        }
+        for row in rows if row.skill_id is not None
+    ]
+
+def upsert_skill_gains(db: Session, user_id: str, gains_table, owner_column, owner_ids: List):
+    """
+    Add the skill gains of lessons or problems to a user's learning levels.
+
+    A single INSERT ... SELECT ... ON CONFLICT DO UPDATE: gains are read from
+    lesson_skills/problem_skills, summed per skill, and inserted or added to the
+    existing user_skills rows, however many skills are involved.
+    """
+    gains = (
+        select(
+            literal(uuid.UUID(str(user_id)), user_skills.c.user_id.type),
+            gains_table.c.skill_id,
+            func.sum(gains_table.c.gain),
+        )
+        .where(owner_column.in_(owner_ids))
+        .group_by(gains_table.c.skill_id)
+    )
+    stmt = dialect_insert(db, user_skills).from_select(
+        [user_skills.c.user_id, user_skills.c.skill_id, user_skills.c.learning_level], gains
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[user_skills.c.user_id, user_skills.c.skill_id],
+        set_={"learning_level": func.coalesce(user_skills.c.learning_level, 0.0) + stmt.excluded.learning_level},
+    )
+    db.execute(stmt)
+
+def addLessonSkillsToUser(user_id: str, lesson_id, db: Session):
+    upsert_skill_gains(db, user_id, lesson_skills, lesson_skills.c.lesson_id, [lesson_id])
+
+def addProblemSkillsToUser(user_id: str, problem_id, db: Session):
+    upsert_skill_gains(db, user_id, problem_skills, problem_skills.c.problem_id, [problem_id])
@@ -1,17 +1,33 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
 from models.models import Base
 from routes import authRoutes, aiRoutes, coursesRoutes
-from db.db import Base, engine
+from services import aiService, promptLogService
+from helpers import profanityHelpers
+from db.db import Base, engine, async_engine
+from middleware.rateLimiter import RateLimitMiddleware, InMemoryRateLimitStore, DEFAULT_RATE_LIMITS
 
 # Commented this out since it conflicts with alembic migrations, it tries to create the tables from models
 # Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await aiService.start_http_client()
+    await profanityHelpers.warm_up()
+    await promptLogService.start()
+    yield
+    await aiService.close_http_client()
+    await promptLogService.stop()
+    profanityHelpers.shutdown()
+    await async_engine.dispose()
+
 app = FastAPI(
     title="Djikstra Backend API",
     description="API for Djikstra learning platform",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Define security scheme for Swagger UI docs
@@ -20,6 +36,9 @@ security_scheme = HTTPBearer(
     auto_error=False,
 )
 
+# Added before CORS so CORS stays the outermost middleware and 429s still carry CORS headers
+app.add_middleware(RateLimitMiddleware, limits=DEFAULT_RATE_LIMITS, store=InMemoryRateLimitStore())
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://dijkstra-reactjs.vercel.app", "https://dijkstra-frontend.vercel.app"],
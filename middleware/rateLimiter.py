@@ -0,0 +1,162 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from helpers.authHelpers import extract_token_from_request, verify_token
+import math
+import os
+import threading
+import time
+
+load_dotenv()
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Token bucket of `capacity` requests, refilled over `per_seconds`."""
+    capacity: int
+    per_seconds: float
+
+    @property
+    def refill_rate(self):
+        return self.capacity / self.per_seconds
+
+    @classmethod
+    def parse(cls, value: str):
+        # "10/60" -> 10 requests per 60 seconds
+        capacity, per_seconds = value.split("/")
+        return cls(int(capacity), float(per_seconds))
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    remaining: int
+    reset_after: float  # seconds until the bucket is full again
+    retry_after: float  # seconds until the request would be allowed, 0 if allowed
+
+# Per route, matched exactly (a trailing slash aside), so e.g. /api/ai-chat/stats isn't
+# limited as /api/ai-chat. A route ending in "/*" also covers every path below it, the
+# longest one wins. "*" applies to every other route.
+DEFAULT_RATE_LIMITS = {
+    "/api/ai-chat": RateLimit.parse(os.getenv("RATE_LIMIT_AI_CHAT") or "10/60"),
+    "/auth/login": RateLimit.parse(os.getenv("RATE_LIMIT_AUTH") or "10/60"),
+    "/auth/register": RateLimit.parse(os.getenv("RATE_LIMIT_AUTH") or "10/60"),
+    "*": RateLimit.parse(os.getenv("RATE_LIMIT_DEFAULT") or "300/60"),
+}
+
+class RateLimitStore(ABC):
+    """
+    Where token buckets live. The in-memory store is per process, a shared backend
+    (e.g. Redis) can be swapped in by implementing consume.
+    """
+
+    @abstractmethod
+    def consume(self, key: str, limit: RateLimit, cost: int = 1) -> RateLimitResult:
+        raise NotImplementedError
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """Buckets sharded over several locks, each shard an LRU bounded to max_keys_per_shard."""
+
+    def __init__(self, shards: int = 16, max_keys_per_shard: int = 10_000):
+        self.max_keys_per_shard = max_keys_per_shard
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+
+    def consume(self, key: str, limit: RateLimit, cost: int = 1):
+        lock, buckets = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with lock:
+            tokens, updated_at = buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated_at) * limit.refill_rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            buckets[key] = (tokens, now)
+            buckets.move_to_end(key)
+            while len(buckets) > self.max_keys_per_shard:
+                buckets.popitem(last=False)
+
+        return RateLimitResult(
+            allowed=allowed,
+            remaining=int(tokens),
+            reset_after=(limit.capacity - tokens) / limit.refill_rate,
+            retry_after=0 if allowed else (cost - tokens) / limit.refill_rate,
+        )
+
+class RateLimitMiddleware:
+    """
+    Token bucket rate limiting per route and client.
+
+    Clients are identified by their authenticated user id, or by IP for anonymous
+    requests. Every limited response carries RateLimit-Limit/Remaining/Reset headers,
+    rejected ones get a 429 with Retry-After.
+    """
+
+    def __init__(self, app, limits: dict = None, store: RateLimitStore = None):
+        self.app = app
+        self.limits = limits if limits is not None else DEFAULT_RATE_LIMITS
+        self.store = store if store is not None else InMemoryRateLimitStore()
+        self._routes = {
+            route.rstrip("/") or "/": route
+            for route in self.limits if route != "*" and not route.endswith("/*")
+        }
+        # Longest prefixes first
+        self._prefixes = sorted((p for p in self.limits if p.endswith("/*")), key=len, reverse=True)
+
+    def limit_for(self, path: str):
+        route = self._routes.get(path.rstrip("/") or "/")
+        if route is not None:
+            return route, self.limits[route]
+        for prefix in self._prefixes:
+            # Only on a segment boundary: /api/* covers /api and /api/x, not /apix
+            base = prefix[:-2]
+            if path == base or path.startswith(base + "/"):
+                return prefix, self.limits[prefix]
+        return "*", self.limits.get("*")
+
+    @staticmethod
+    def client_key(request: Request):
+        token = extract_token_from_request(request)
+        payload = verify_token(token) if token else None
+        if payload and payload.get("id"):
+            return f"user:{payload['id']}"
+        # Heroku's router appends the address it saw to X-Forwarded-For, so the last
+        # entry is the one the client can't spoof
+        forwarded_for = request.headers.get("x-forwarded-for")
+        if forwarded_for:
+            return f"ip:{forwarded_for.split(',')[-1].strip()}"
+        return f"ip:{request.client.host if request.client else 'unknown'}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        route, limit = self.limit_for(scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        result = self.store.consume(f"{route}|{self.client_key(request)}", limit)
+        headers = {
+            "RateLimit-Limit": str(limit.capacity),
+            "RateLimit-Remaining": str(result.remaining),
+            "RateLimit-Reset": str(math.ceil(result.reset_after)),
+        }
+        if not result.allowed:
+            response = JSONResponse(
+                {"detail": "Too many requests, please slow down."},
+                status_code=429,
+                headers={**headers, "Retry-After": str(math.ceil(result.retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Table, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, DateTime, Table, ForeignKey, Float, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from db.db import Base
@@ -95,12 +95,14 @@ class PromptLog(Base):
     user_prompt = Column(String, nullable=False)
     llm_response = Column(String, nullable=False)
     tokens_used = Column(Integer, nullable=False)
-    timestamp = Column(DateTime, default=datetime.now(timezone.utc), nullable=False)
+    # Naive UTC: the column is TIMESTAMP WITHOUT TIME ZONE, which asyncpg won't bind an aware datetime to
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None), nullable=False)
 
     user = relationship("User")
 
 class UserLessonCompletion(Base):
     __tablename__ = "user_lesson_completion"
+    __table_args__ = (UniqueConstraint("user_id", "lesson_id", name="uq_user_lesson_completion"),)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     lesson_id = Column(UUID(as_uuid=True), ForeignKey("lessons.id"), nullable=False)
@@ -111,6 +113,7 @@ class UserLessonCompletion(Base):
 
 class UserProblemCompletion(Base):
     __tablename__ = "user_problem_completion"
+    __table_args__ = (UniqueConstraint("user_id", "problem_id", name="uq_user_problem_completion"),)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     problem_id = Column(UUID(as_uuid=True), ForeignKey("practice_problems.id"), nullable=False)
@@ -127,4 +130,17 @@ class UserCourseOrderProgress(Base):
     last_updated = Column(DateTime(timezone=True), default=datetime.now(timezone.utc))
 
     user = relationship("User")
-    course = relationship("Course")
\ No newline at end of file
+    course = relationship("Course")
+
+class UserUnitProgress(Base):
+    # Materialized per-unit progress, kept up to date by the completion routes
+    # and rebuildable from the completion tables (see rebuild_progress.py)
+    __tablename__ = "user_unit_progress"
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    unit_id = Column(UUID(as_uuid=True), ForeignKey("units.id"), primary_key=True)
+    completed_parts = Column(Integer, nullable=False, default=0)
+    total_parts = Column(Integer, nullable=False, default=1)  # 1 lesson + practice problems
+    last_updated = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    user = relationship("User")
+    unit = relationship("Unit")
@@ -0,0 +1,32 @@
+from helpers.progressHelpers import rebuild_user_unit_progress, check_user_unit_progress
+import argparse
+
+# Rebuilds or checks the materialized user_unit_progress table against the completion tables.
+#   python rebuild_progress.py                 rebuild for every user
+#   python rebuild_progress.py --user <id>     rebuild for one user
+#   python rebuild_progress.py --check         report mismatches without writing (exit code 1 if any)
+
+if __name__ == "__main__":
+    from db.db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild or check user_unit_progress")
+    parser.add_argument("--user", dest="user_id", default=None, help="Only this user id")
+    parser.add_argument("--check", action="store_true", help="Only report mismatches")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.check:
+            mismatches = check_user_unit_progress(db, args.user_id)
+            for mismatch in mismatches:
+                print(
+                    f"user {mismatch['user_id']} unit {mismatch['unit_id']}: "
+                    f"stored {mismatch['stored']}, expected {mismatch['expected']}"
+                )
+            print(f"{len(mismatches)} mismatched rows.")
+            raise SystemExit(1 if mismatches else 0)
+
+        rows = rebuild_user_unit_progress(db, args.user_id)
+        print(f"Rebuilt {rows} user_unit_progress rows.")
+    finally:
+        db.close()
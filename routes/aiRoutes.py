@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, Request
 from schemas.schemas import ChatRequest
-from services import aiService
+from services import aiService, conversationService, promptLogService
 from helpers.authHelpers import get_current_user
+from helpers import profanityHelpers
+from helpers.cacheHelpers import learning_context_cache
 from models.models import User, PromptLog
 from typing import List
 from schemas import schemas
-from db.db import get_db
+from db.db import get_db, get_async_db
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
 
@@ -15,11 +18,36 @@ router = APIRouter()
 def get_prompt_logs(user_id: str, db: Session = Depends(get_db)):
     return db.query(PromptLog).filter(PromptLog.user_id == user_id).all()
 
+@router.get("/ai-chat/stats")
+def ai_chat_stats(current_user: User = Depends(get_current_user)):
+    """
+    Runtime stats of the AI chat path.
+
+    - **http_pool**: connections of the shared inference HTTP client.
+    - **streaming**: time to first token of recent streamed replies.
+    - **response_cache**: size and hit rate of the tutor response cache.
+    - **single_flight**: upstream calls in flight and requests that joined one.
+    - **profanity**: micro-batches of the profanity classifier.
+    - **prompt_log**: queue depth and written, spilled and dropped rows of the PromptLog writer.
+    - **learning_context**: size and hit rate of the per-user learning context cache.
+    - **conversations**: chat sessions kept in memory.
+    """
+    return {
+        "http_pool": aiService.http_pool_stats(),
+        "streaming": aiService.streaming_stats(),
+        "response_cache": aiService.response_cache_stats(),
+        "single_flight": aiService.single_flight_stats(),
+        "profanity": profanityHelpers.profanity_stats(),
+        "prompt_log": promptLogService.prompt_log_stats(),
+        "learning_context": learning_context_cache.stats(),
+        "conversations": conversationService.conversation_cache.stats(),
+    }
+
 @router.post("/ai-chat")
 async def ai_chat(
     req: ChatRequest,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
 ):
     """
@@ -30,6 +58,7 @@ async def ai_chat(
     - **db**: The database session.
     - **current_user**: The authenticated user making the request.
 
-    Returns a response generated by the AI service.
+    Returns a response generated by the AI service, or with `stream: true` a
+    `text/event-stream` of chat completion chunks ending with a `metrics` event and `[DONE]`.
     """
     return await aiService.get_response(req, db, current_user)
\ No newline at end of file
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, Response, Request
-from sqlalchemy.orm import Session
-from db.db import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.db import get_async_db
 from schemas import schemas
 from helpers import authHelpers
 from services import authService
@@ -8,18 +8,18 @@ from services import authService
 router = APIRouter()
 
 @router.post("/register", response_model=schemas.UserOut)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    return authService.register_user(user, db)
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    return await authService.register_user(user, db)
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(
+async def login(
     response: Response ,
     form_data: schemas.UserLogin,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 
 ):
-    token_data = authService.login_user(form_data, db)
+    token_data = await authService.login_user(form_data, db)
 
     response.set_cookie(
         key="access_token",
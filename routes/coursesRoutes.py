@@ -1,30 +1,74 @@
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.orm import Session
-from db.db import get_db
-from models.models import Course, Unit, Lesson, PracticeProblem, Skill, User, user_skills, lesson_skills, problem_skills, UserCourseOrderProgress, UserLessonCompletion, UserProblemCompletion
+from db.db import get_db, dialect_insert
+from models.models import Course, Unit, Lesson, PracticeProblem, Skill, UserCourseOrderProgress, UserLessonCompletion, UserProblemCompletion, UserUnitProgress
 from schemas import schemas
-from typing import List
+from services import completionService
+from helpers.courseHelpers import query_course_tree, query_unit_tree
+from helpers.cacheHelpers import catalog_response, bump_content_version, user_dashboard_response, invalidate_user_dashboards, invalidate_learning_context
+from helpers.skillHelpers import addLessonSkillsToUser, addProblemSkillsToUser, query_user_skills, user_skills_out
+from helpers.progressHelpers import progress_percentage, record_unit_part_completed, refresh_unit_total_parts, unit_is_unlocked, unlock_next_unit
+from typing import List, Literal, Optional, Union
+import uuid
 
 router = APIRouter()
 
-# --- Courses & Units ---
-@router.get("/courses", response_model=List[schemas.CourseOut])
-def list_courses(db: Session = Depends(get_db)):
-    return db.query(Course).all()
+MAX_BATCH_IDS = 100
+
+def parse_batch_ids(ids: List[str]):
+    # Accepts both ids=a&ids=b and ids=a,b, keeps the request order and drops duplicates
+    requested = list(dict.fromkeys(i.strip() for raw in ids for i in raw.split(",") if i.strip()))
+    if len(requested) > MAX_BATCH_IDS:
+        raise HTTPException(400, f"At most {MAX_BATCH_IDS} ids can be requested at once")
+    parsed = {}
+    for raw in requested:
+        try:
+            parsed[raw] = uuid.UUID(raw)
+        except ValueError:
+            pass  # Reported as missing
+    return requested, parsed
+
+def batch_result(requested: List[str], parsed: dict, rows):
+    by_id = {row.id: row for row in rows}
+    items, missing = [], []
+    for raw in requested:
+        row = by_id.get(parsed.get(raw))
+        if row is None:
+            missing.append(raw)
+        else:
+            items.append(row)
+    return {"items": items, "missing": missing}
 
-@router.get("/courses/{course_id}", response_model=schemas.CourseOut)
-def get_course(course_id: str, db: Session = Depends(get_db)):
-    course = db.query(Course).filter(Course.id == course_id).first()
-    if not course:
-        raise HTTPException(404, "Course not found")
-    return course
+# --- Courses & Units ---
+# depth=summary returns ids, names and order only, without lesson content or problem data
+CourseDepth = Literal["full", "summary"]
+
+def course_schema(depth: CourseDepth):
+    return schemas.CourseSummaryOut if depth == "summary" else schemas.CourseOut
+
+@router.get("/courses", response_model=Union[List[schemas.CourseOut], List[schemas.CourseSummaryOut]])
+def list_courses(request: Request, depth: CourseDepth = "full", db: Session = Depends(get_db)):
+    def load():
+        courses = query_course_tree(db, summary=depth == "summary").all()
+        return [course_schema(depth).model_validate(course, from_attributes=True) for course in courses]
+    return catalog_response(request, "courses", depth, load)
+
+@router.get("/courses/{course_id}", response_model=Union[schemas.CourseOut, schemas.CourseSummaryOut])
+def get_course(course_id: str, request: Request, depth: CourseDepth = "full", db: Session = Depends(get_db)):
+    def load():
+        course = query_course_tree(db, summary=depth == "summary").filter(Course.id == course_id).first()
+        if not course:
+            raise HTTPException(404, "Course not found")
+        return course_schema(depth).model_validate(course, from_attributes=True)
+    return catalog_response(request, "course", (course_id, depth), load)
 
 # @router.post("/courses", response_model=schemas.CourseOut)
 def create_course(course: schemas.CourseCreate, db: Session = Depends(get_db)):
     new_course = Course(**course.dict())
     db.add(new_course)
     db.commit()
+    bump_content_version()
     db.refresh(new_course)
     return new_course
 
@@ -36,6 +80,7 @@ def update_course(course_id: str, course: schemas.CourseCreate, db: Session = De
     for k, v in course.dict().items():
         setattr(db_course, k, v)
     db.commit()
+    bump_content_version()
     db.refresh(db_course)
     return db_course
 
@@ -48,18 +93,27 @@ def update_course(course_id: str, course: schemas.CourseCreate, db: Session = De
 #     db.commit()
 #     return {"detail": "Lesson deleted"}
 
+@router.get("/units", response_model=schemas.UnitBatchOut)
+def get_units(ids: List[str] = Query(...), db: Session = Depends(get_db)):
+    requested, parsed = parse_batch_ids(ids)
+    units = query_unit_tree(db).filter(Unit.id.in_(parsed.values())).all() if parsed else []
+    return batch_result(requested, parsed, units)
+
 @router.get("/units/{unit_id}", response_model=schemas.UnitOut)
-def get_unit(unit_id: str, db: Session = Depends(get_db)):
-    unit = db.query(Unit).filter(Unit.id == unit_id).first()
-    if not unit:
-        raise HTTPException(404, "Unit not found")
-    return unit
+def get_unit(unit_id: str, request: Request, db: Session = Depends(get_db)):
+    def load():
+        unit = query_unit_tree(db).filter(Unit.id == unit_id).first()
+        if not unit:
+            raise HTTPException(404, "Unit not found")
+        return schemas.UnitOut.model_validate(unit, from_attributes=True)
+    return catalog_response(request, "unit", unit_id, load)
 
 # @router.post("/units", response_model=schemas.UnitOut)
 def create_unit(unit: schemas.UnitCreate, db: Session = Depends(get_db)):
     new_unit = Unit(**unit.dict())
     db.add(new_unit)
     db.commit()
+    bump_content_version()
     db.refresh(new_unit)
     return new_unit
 
@@ -71,6 +125,7 @@ def update_unit(unit_id: str, unit: schemas.UnitCreate, db: Session = Depends(ge
     for k, v in unit.dict().items():
         setattr(db_unit, k, v)
     db.commit()
+    bump_content_version()
     db.refresh(db_unit)
     return db_unit
 
@@ -84,18 +139,27 @@ def update_unit(unit_id: str, unit: schemas.UnitCreate, db: Session = Depends(ge
 #     return {"detail": "unit deleted"}
 
 # --- Lessons ---
+@router.get("/lessons", response_model=schemas.LessonBatchOut)
+def get_lessons(ids: List[str] = Query(...), db: Session = Depends(get_db)):
+    requested, parsed = parse_batch_ids(ids)
+    lessons = db.query(Lesson).filter(Lesson.id.in_(parsed.values())).all() if parsed else []
+    return batch_result(requested, parsed, lessons)
+
 @router.get("/lessons/{lesson_id}", response_model=schemas.LessonOut)
-def get_lesson(lesson_id: str, db: Session = Depends(get_db)):
-    lesson = db.query(Lesson).filter(Lesson.id == lesson_id).first()
-    if not lesson:
-        raise HTTPException(404, "Lesson not found")
-    return lesson
+def get_lesson(lesson_id: str, request: Request, db: Session = Depends(get_db)):
+    def load():
+        lesson = db.query(Lesson).filter(Lesson.id == lesson_id).first()
+        if not lesson:
+            raise HTTPException(404, "Lesson not found")
+        return schemas.LessonOut.model_validate(lesson, from_attributes=True)
+    return catalog_response(request, "lesson", lesson_id, load)
 
 # @router.post("/lessons", response_model=schemas.LessonOut)
 def create_lesson(lesson: schemas.LessonCreate, db: Session = Depends(get_db)):
     new_lesson = Lesson(**lesson.dict())
     db.add(new_lesson)
     db.commit()
+    bump_content_version()
     db.refresh(new_lesson)
     return new_lesson
 
@@ -107,6 +171,7 @@ def update_lesson(lesson_id: str, lesson: schemas.LessonCreate, db: Session = De
     for k, v in lesson.dict().items():
         setattr(db_lesson, k, v)
     db.commit()
+    bump_content_version()
     db.refresh(db_lesson)
     return db_lesson
 
@@ -117,21 +182,48 @@ def delete_lesson(lesson_id: str, db: Session = Depends(get_db)):
         raise HTTPException(404, "Lesson not found")
     db.delete(db_lesson)
     db.commit()
+    bump_content_version()
     return {"detail": "Lesson deleted"}
 
 # --- Practice Problems ---
+@router.get("/practice_problems", response_model=schemas.PracticeProblemBatchOut)
+def get_problems(
+    ids: Optional[List[str]] = Query(None),
+    unit_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    if ids is None and unit_id is None:
+        raise HTTPException(400, "Either ids or unit_id is required")
+
+    query = db.query(PracticeProblem)
+    if unit_id is not None:
+        query = query.filter(PracticeProblem.unit_id == unit_id)
+    if ids is None:
+        # Whole unit, nothing can be missing
+        return {"items": query.all(), "missing": []}
+
+    # With both filters, ids outside of the unit are reported as missing
+    requested, parsed = parse_batch_ids(ids)
+    problems = query.filter(PracticeProblem.id.in_(parsed.values())).all() if parsed else []
+    return batch_result(requested, parsed, problems)
+
 @router.get("/practice_problems/{problem_id}", response_model=schemas.PracticeProblemOut)
-def get_problem(problem_id: str, db: Session = Depends(get_db)):
-    problem = db.query(PracticeProblem).filter(PracticeProblem.id == problem_id).first()
-    if not problem:
-        raise HTTPException(404, "Practice problem not found")
-    return problem
+def get_problem(problem_id: str, request: Request, db: Session = Depends(get_db)):
+    def load():
+        problem = db.query(PracticeProblem).filter(PracticeProblem.id == problem_id).first()
+        if not problem:
+            raise HTTPException(404, "Practice problem not found")
+        return schemas.PracticeProblemOut.model_validate(problem, from_attributes=True)
+    return catalog_response(request, "practice_problem", problem_id, load)
 
 # @router.post("/practice_problems", response_model=schemas.PracticeProblemOut)
 def create_problem(problem: schemas.PracticeProblemCreate, db: Session = Depends(get_db)):
     new_problem = PracticeProblem(**problem.dict())
     db.add(new_problem)
+    db.flush()
+    refresh_unit_total_parts(db, new_problem.unit_id)
     db.commit()
+    bump_content_version()
     db.refresh(new_problem)
     return new_problem
 
@@ -140,9 +232,14 @@ def update_problem(problem_id: str, problem: schemas.PracticeProblemCreate, db:
     db_problem = db.query(PracticeProblem).filter(PracticeProblem.id == problem_id).first()
     if not db_problem:
         raise HTTPException(404, "Practice problem not found")
+    previous_unit_id = db_problem.unit_id
     for k, v in problem.dict().items():
         setattr(db_problem, k, v)
+    db.flush()
+    for unit_id in {previous_unit_id, db_problem.unit_id}:
+        refresh_unit_total_parts(db, unit_id)
     db.commit()
+    bump_content_version()
     db.refresh(db_problem)
     return db_problem
 
@@ -152,105 +249,141 @@ def delete_problem(problem_id: str, db: Session = Depends(get_db)):
     if not db_problem:
         raise HTTPException(404, "Practice problem not found")
     db.delete(db_problem)
+    db.flush()
+    refresh_unit_total_parts(db, db_problem.unit_id)
     db.commit()
+    bump_content_version()
     return {"detail": "Practice problem deleted"}
 
 # --- Skills ---
 @router.get("/skills", response_model=List[schemas.SkillOut])
-def list_skills(db: Session = Depends(get_db)):
-    return db.query(Skill).all()
+def list_skills(request: Request, db: Session = Depends(get_db)):
+    return catalog_response(
+        request, "skills", None,
+        lambda: [schemas.SkillOut.model_validate(skill, from_attributes=True) for skill in db.query(Skill).all()]
+    )
 
 @router.get("/skills/{skill_id}", response_model=schemas.SkillOut)
-def get_skill(skill_id: str, db: Session = Depends(get_db)):
-    skill = db.query(Skill).filter(Skill.id == skill_id).first()
-    if not skill:
-        raise HTTPException(404, "Skill not found")
-    return skill
+def get_skill(skill_id: str, request: Request, db: Session = Depends(get_db)):
+    def load():
+        skill = db.query(Skill).filter(Skill.id == skill_id).first()
+        if not skill:
+            raise HTTPException(404, "Skill not found")
+        return schemas.SkillOut.model_validate(skill, from_attributes=True)
+    return catalog_response(request, "skill", skill_id, load)
 
 # --- User Progress & Skills ---
 @router.get("/users/{user_id}/skills", response_model=List[schemas.UserSkillOut])
-def get_user_skills(user_id: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+def get_user_skills(user_id: str, include_zero: bool = False, db: Session = Depends(get_db)):
+    rows = query_user_skills(db, user_id, include_zero).all()
+    if not rows:
         raise HTTPException(404, "User not found")
-    # You may need to join with the user_skills table to get the learning levels
-    skills_user = db.query(user_skills).filter(user_skills.c.user_id == user_id).all()
-    skills = []
-    for user_skill in skills_user:
-        skill = db.query(Skill).filter(Skill.id == user_skill.skill_id).first()
-        if skill:
-            skills.append({
-                "id": skill.id,
-                "name": skill.name,
-                "description": skill.description,
-                "learning_level": user_skill.learning_level
-            })
-    return skills
-
-def get_progress_percentage(
-        unit: Unit, 
-        lesson_completions: List[UserLessonCompletion], 
-        problem_completions: List[UserProblemCompletion]
-    ):
-    # Units always have only one lesson
-    total_parts = 1 + len(unit.practice_problems)
-
-    if total_parts == 0:
-        return 0  # Avoid division by zero if there are no parts in the unit
-
-    completed_lessons = 1 if unit.lesson.id in [lc.lesson_id for lc in lesson_completions] else 0
-    completed_problems = sum(1 for problem in unit.practice_problems if problem.id in [pc.problem_id for pc in problem_completions])
-    completed_parts = completed_lessons + completed_problems
-    return int((completed_parts / total_parts) * 100)
-
+    return user_skills_out(rows)
 
 @router.get("/users/{user_id}/units", response_model=List[schemas.UserUnitProgressOut])
 def get_user_units(user_id: str, db: Session = Depends(get_db)):
-    lesson_completions = db.query(UserLessonCompletion).filter(UserLessonCompletion.user_id == user_id).all()
-    problem_completions = db.query(UserProblemCompletion).filter(UserProblemCompletion.user_id == user_id).all()
-    # Extract unit_ids from completions
-    lesson_unit_ids = [completion.lesson.unit_id for completion in lesson_completions]
-    problem_unit_ids = [completion.problem.unit_id for completion in problem_completions]
-    
-    # Get unique unit_ids
-    all_unit_ids = set(lesson_unit_ids + problem_unit_ids)
-    units = db.query(Unit).filter(Unit.id.in_(all_unit_ids)).all()
-
-    user_units = []
-    for unit in units:
-        progress_percentage = get_progress_percentage(unit, lesson_completions, problem_completions)
-        user_units.append({
-            "user_id": user_id,
-            "unit_id": unit.id,
-            "completion_percentage": progress_percentage,
-            "last_updated": datetime.now(timezone.utc)
-        })
-
-    return user_units
+    units_progress = db.query(UserUnitProgress).filter(UserUnitProgress.user_id == user_id).all()
+    return [
+        {
+            "user_id": progress.user_id,
+            "unit_id": progress.unit_id,
+            "completion_percentage": progress_percentage(progress.completed_parts, progress.total_parts),
+            "last_updated": progress.last_updated
+        }
+        for progress in units_progress
+    ]
 
 @router.get("/users/{user_id}/units/{unit_id}/progress", response_model=schemas.UserUnitProgressOut)
 def get_user_unit_progress(user_id: str, unit_id: str, db: Session = Depends(get_db)):
-    unit = db.query(Unit).filter(Unit.id == unit_id).first()    
-    if not unit:
-        raise HTTPException(404, "Unit not found")
-    
-    lesson_completions = db.query(UserLessonCompletion).filter(
-        UserLessonCompletion.user_id == user_id,
-        UserLessonCompletion.lesson.has(unit_id=unit_id)
-    ).all()
-    problem_completions = db.query(UserProblemCompletion).filter(
-        UserProblemCompletion.user_id == user_id,
-        UserProblemCompletion.problem.has(unit_id=unit_id)
-    ).all()
-    completion_percentage = get_progress_percentage(unit, lesson_completions, problem_completions)
+    unit_progress = db.query(UserUnitProgress).filter(
+        UserUnitProgress.user_id == user_id,
+        UserUnitProgress.unit_id == unit_id
+    ).first()
+    if unit_progress:
+        completion_percentage = progress_percentage(unit_progress.completed_parts, unit_progress.total_parts)
+        last_updated = unit_progress.last_updated
+    else:
+        # Nothing completed in this unit yet
+        if not db.query(Unit.id).filter(Unit.id == unit_id).first():
+            raise HTTPException(404, "Unit not found")
+        completion_percentage = 0
+        last_updated = datetime.now(timezone.utc)
+
     progress = {
         "user_id": user_id,
         "unit_id": unit_id,
         "completion_percentage": completion_percentage,
-        "last_updated": datetime.now(timezone.utc)
+        "last_updated": last_updated
     }
     return progress
 
+@router.get("/users/{user_id}/courses/{course_id}/dashboard", response_model=schemas.CourseDashboardOut)
+def get_course_dashboard(user_id: str, course_id: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Everything needed to render a course for a user in one call: unit progress, the
+    unlocked unit order, completed lesson and problem ids and skill levels.
+
+    Built from a fixed set of 6 queries and cached per user until their next completion.
+    """
+    def load():
+        units = (
+            db.query(Course.id.label("course_id"), Unit.id, Unit.name, Unit.order)
+            .outerjoin(Unit, Unit.course_id == Course.id)
+            .filter(Course.id == course_id)
+            .order_by(Unit.order)
+            .all()
+        )
+        if not units:
+            raise HTTPException(404, "Course not found")
+        units = [unit for unit in units if unit.id is not None]
+        unit_ids = [unit.id for unit in units]
+
+        skills = query_user_skills(db, user_id).all()
+        if not skills:
+            raise HTTPException(404, "User not found")
+
+        current_order = db.query(UserCourseOrderProgress.current_order).filter(
+            UserCourseOrderProgress.user_id == user_id,
+            UserCourseOrderProgress.course_id == course_id
+        ).scalar() or 1
+        units_progress = {
+            progress.unit_id: progress_percentage(progress.completed_parts, progress.total_parts)
+            for progress in db.query(UserUnitProgress).filter(
+                UserUnitProgress.user_id == user_id,
+                UserUnitProgress.unit_id.in_(unit_ids)
+            )
+        }
+        completed_lesson_ids = [
+            lesson_id for (lesson_id,) in db.query(UserLessonCompletion.lesson_id)
+            .join(Lesson, Lesson.id == UserLessonCompletion.lesson_id)
+            .filter(UserLessonCompletion.user_id == user_id, Lesson.unit_id.in_(unit_ids))
+        ]
+        completed_problem_ids = [
+            problem_id for (problem_id,) in db.query(UserProblemCompletion.problem_id)
+            .join(PracticeProblem, PracticeProblem.id == UserProblemCompletion.problem_id)
+            .filter(UserProblemCompletion.user_id == user_id, PracticeProblem.unit_id.in_(unit_ids))
+        ]
+
+        return schemas.CourseDashboardOut(
+            user_id=user_id,
+            course_id=course_id,
+            current_order=current_order,
+            units=[
+                schemas.DashboardUnitOut(
+                    unit_id=unit.id,
+                    name=unit.name,
+                    order=unit.order,
+                    completion_percentage=units_progress.get(unit.id, 0),
+                    unlocked=unit.order <= current_order,
+                )
+                for unit in units
+            ],
+            completed_lesson_ids=completed_lesson_ids,
+            completed_problem_ids=completed_problem_ids,
+            skills=user_skills_out(skills),
+        )
+    return user_dashboard_response(request, user_id, course_id, load)
+
 # --- Lesson and Problem Completion ---
 @router.get("/users/{user_id}/complete", response_model=schemas.UserCompletions)
 def get_user_completions(user_id: str, db: Session = Depends(get_db)):
@@ -261,185 +394,95 @@ def get_user_completions(user_id: str, db: Session = Depends(get_db)):
     }
     return completions
 
-def addLessonSkillsToUser(user: User, skills: List[Skill], lesson_id: str, db: Session):
-    for skill in skills:
-        # Check if user already has this skill
-        existing_user_skill = db.query(user_skills).filter(
-            user_skills.c.user_id == user.id,
-            user_skills.c.skill_id == skill.id
-        ).first()
-        
-        if existing_user_skill:
-            # Update existing learning level by adding the gain
-            # Get the gain from lesson_skills association table
-            lesson_skill_gain = db.query(lesson_skills.c.gain).filter(
-                lesson_skills.c.skill_id == skill.id,
-                lesson_skills.c.lesson_id == lesson_id
-            ).first()
-            
-            gain_value = lesson_skill_gain[0] if lesson_skill_gain else 0.1  # Default gain
-            
-            # Update the learning level
-            db.execute(
-                user_skills.update()
-                .where(user_skills.c.user_id == user.id)
-                .where(user_skills.c.skill_id == skill.id)
-                .values(learning_level=user_skills.c.learning_level + gain_value)
-            )
-        else:
-            # Create new user_skills entry
-            lesson_skill_gain = db.query(lesson_skills.c.gain).filter(
-                lesson_skills.c.skill_id == skill.id
-            ).first()
-            
-            initial_level = lesson_skill_gain[0] if lesson_skill_gain else 0.1  # Default gain
-            
-            # Insert new user_skills entry
-            db.execute(
-                user_skills.insert().values(
-                    user_id=user.id,
-                    skill_id=skill.id,
-                    learning_level=initial_level
-                )
-            )
-
-def addProblemSkillsToUser(user: User, skills: List[Skill], problem_id: str, db: Session):
-    for skill in skills:
-        # Check if user already has this skill
-        existing_user_skill = db.query(user_skills).filter(
-            user_skills.c.user_id == user.id,
-            user_skills.c.skill_id == skill.id
-        ).first()
-        
-        if existing_user_skill:
-            # Update existing learning level by adding the gain
-            # Get the gain from problem_skills association table
-            problem_skill_gain = db.query(problem_skills.c.gain).filter(
-                problem_skills.c.skill_id == skill.id,
-                problem_skills.c.problem_id == problem_id
-            ).first()
-            
-            gain_value = problem_skill_gain[0] if problem_skill_gain else 0.1  # Default gain
-            
-            # Update the learning level
-            db.execute(
-                user_skills.update()
-                .where(user_skills.c.user_id == user.id)
-                .where(user_skills.c.skill_id == skill.id)
-                .values(learning_level=user_skills.c.learning_level + gain_value)
-            )
-        else:
-            # Create new user_skills entry
-            problem_skill_gain = db.query(problem_skills.c.gain).filter(
-                problem_skills.c.skill_id == skill.id
-            ).first()
-            
-            initial_level = problem_skill_gain[0] if problem_skill_gain else 0.1  # Default gain
-            
-            # Insert new user_skills entry
-            db.execute(
-                user_skills.insert().values(
-                    user_id=user.id,
-                    skill_id=skill.id,
-                    learning_level=initial_level
-                )
-            )
-
+# Completions rely on the unique (user_id, lesson_id) / (user_id, problem_id) constraints:
+# the insert does nothing on conflict, so duplicates and concurrent retries can't double
+# count progress or skill gains, and everything is committed in one transaction.
 @router.post("/users/{user_id}/lessons/{lesson_id}/complete", response_model=schemas.UserLessonCompletion)
 def complete_lesson(user_id: str, lesson_id: str, db: Session = Depends(get_db)):
-    # Check if this completion already exists
-    existing_completion = db.query(UserLessonCompletion).filter(
-        UserLessonCompletion.user_id == user_id,
-        UserLessonCompletion.lesson_id == lesson_id
-    ).first()
-    if existing_completion:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Lesson already completed")
-    
-    lesson = db.query(Lesson).filter(Lesson.id == lesson_id).first()
+    lesson = (
+        db.query(Lesson.id, Unit.id.label("unit_id"), Unit.course_id, Unit.order)
+        .outerjoin(Unit, Unit.id == Lesson.unit_id)
+        .filter(Lesson.id == lesson_id)
+        .first()
+    )
     if not lesson:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lesson not found")
-    
-    unit = db.query(Unit).filter(Unit.id == lesson.unit_id).first()
-    
-    if not unit:
+    if lesson.unit_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lesson's unit not found")
-    
-    order_progress = db.query(UserCourseOrderProgress).filter(
-            UserCourseOrderProgress.user_id == user_id,
-            UserCourseOrderProgress.course_id == unit.course_id
+
+    if not unit_is_unlocked(db, user_id, lesson.course_id, lesson.order):
+        # Completing the unit's last part locks it, so a retry of that completion lands here
+        already_completed = db.query(UserLessonCompletion.id).filter(
+            UserLessonCompletion.user_id == user_id,
+            UserLessonCompletion.lesson_id == lesson.id
         ).first()
-    
-    # Check order constraints
-    unit_order = unit.order
-    current_order = order_progress.current_order if order_progress else None
-    
-    if (order_progress is None and unit_order != 1) or (order_progress is not None and current_order != unit_order):
+        if already_completed:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Lesson already completed")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="This unit is either finished or not unlocked yet")
-    
-    
-    db_lesson_completion = UserLessonCompletion(user_id=user_id, lesson_id=lesson_id)
-    db.add(db_lesson_completion)
-    addLessonSkillsToUser(db.query(User).filter(User.id == user_id).first(), lesson.skills, str(lesson.id), db)
+
+    db_lesson_completion = db.execute(
+        dialect_insert(db, UserLessonCompletion)
+        .values(user_id=user_id, lesson_id=lesson.id, completed_at=datetime.now(timezone.utc))
+        .on_conflict_do_nothing(index_elements=[UserLessonCompletion.user_id, UserLessonCompletion.lesson_id])
+        .returning(UserLessonCompletion.id, UserLessonCompletion.user_id, UserLessonCompletion.lesson_id, UserLessonCompletion.completed_at)
+    ).first()
+    if db_lesson_completion is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Lesson already completed")
+
+    record_unit_part_completed(db, user_id, lesson.unit_id)
+    addLessonSkillsToUser(user_id, lesson.id, db)
     db.commit()
-    db.refresh(db_lesson_completion)
-    return db_lesson_completion
+    invalidate_user_dashboards(user_id)
+    invalidate_learning_context(user_id)
+    return db_lesson_completion._asdict()
 
 @router.post("/users/{user_id}/practice_problems/{problem_id}/complete", response_model=schemas.UserProblemCompletion)
 def complete_problem(user_id: str, problem_id: str, db: Session = Depends(get_db)):
-    existing_completion = db.query(UserProblemCompletion).filter(
-        UserProblemCompletion.user_id == user_id,
-        UserProblemCompletion.problem_id == problem_id
-    ).first()
-    if existing_completion:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Lesson already completed")
-    
-    problem = db.query(PracticeProblem).filter(PracticeProblem.id == problem_id).first()
+    problem = (
+        db.query(PracticeProblem.id, Unit.id.label("unit_id"), Unit.course_id, Unit.order)
+        .outerjoin(Unit, Unit.id == PracticeProblem.unit_id)
+        .filter(PracticeProblem.id == problem_id)
+        .first()
+    )
     if not problem:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Problem not found")
-    
-    unit = db.query(Unit).filter(Unit.id == problem.unit_id).first()
-    
-    if not unit:
+    if problem.unit_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Problem's unit not found")
 
-    order_progress = db.query(UserCourseOrderProgress).filter(
-            UserCourseOrderProgress.user_id == user_id,
-            UserCourseOrderProgress.course_id == unit.course_id
+    if not unit_is_unlocked(db, user_id, problem.course_id, problem.order):
+        # Completing the unit's last part locks it, so a retry of that completion lands here
+        already_completed = db.query(UserProblemCompletion.id).filter(
+            UserProblemCompletion.user_id == user_id,
+            UserProblemCompletion.problem_id == problem.id
         ).first()
-    
-    print("order_progress: " + str(order_progress.current_order) if order_progress is not None else "1")
-    
-    if (order_progress is None and unit.order != 1) or (order_progress is not None and order_progress.current_order != unit.order):
+        if already_completed:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Lesson already completed")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="This unit is either finished or not unlocked yet")
-    
-    db_problem_completion = UserProblemCompletion(user_id=user_id, problem_id=problem_id)
-    db.add(db_problem_completion)
-    addProblemSkillsToUser(db.query(User).filter(User.id == user_id).first(), problem.skills, str(problem.id), db)
-    db.commit()
-    db.refresh(db_problem_completion)
-
-    print(f"unit_progress: {get_user_unit_progress(user_id, str(unit.id), db)}")
-
-    # Check if the user has completed all problems in the unit
-    if get_user_unit_progress(user_id, str(unit.id), db)["completion_percentage"] == 100:
-        # If this is the last problem, mark the unit as complete
-        
-        if order_progress is None and unit.order != 1:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot complete last problem without completing previous units")
-        
-        if order_progress is not None:
-            # Update existing progress
-            setattr(order_progress, 'current_order', order_progress.current_order + 1)
-            setattr(order_progress, 'last_updated', datetime.now(timezone.utc))
-            db.commit()
-        else:
-            order_progress = UserCourseOrderProgress(
-                user_id=user_id,
-                course_id=unit.course_id,
-                current_order=2,  # Fix: Set to 2 since we're moving to next unit
-                last_updated=datetime.now(timezone.utc)
-            )
-            db.add(order_progress)
-            db.commit()
 
-    return db_problem_completion
+    db_problem_completion = db.execute(
+        dialect_insert(db, UserProblemCompletion)
+        .values(user_id=user_id, problem_id=problem.id, completed_at=datetime.now(timezone.utc))
+        .on_conflict_do_nothing(index_elements=[UserProblemCompletion.user_id, UserProblemCompletion.problem_id])
+        .returning(UserProblemCompletion.id, UserProblemCompletion.user_id, UserProblemCompletion.problem_id, UserProblemCompletion.completed_at)
+    ).first()
+    if db_problem_completion is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Lesson already completed")
+
+    unit_progress = record_unit_part_completed(db, user_id, problem.unit_id)
+    addProblemSkillsToUser(user_id, problem.id, db)
+    # Finishing the unit on a problem unlocks the next one
+    if unit_progress.completed_parts >= unit_progress.total_parts:
+        unlock_next_unit(db, user_id, problem.course_id, problem.order)
+    db.commit()
+    invalidate_user_dashboards(user_id)
+    invalidate_learning_context(user_id)
+    return db_problem_completion._asdict()
+
+@router.post("/users/{user_id}/completions:batch", response_model=schemas.CompletionBatchOut)
+def complete_batch(user_id: uuid.UUID, batch: schemas.CompletionBatchIn, db: Session = Depends(get_db)):
+    """
+    Replay queued lesson and practice problem completions in order.
+
+    Returns one result per item: completed, already_completed, not_found or locked.
+    """
+    return completionService.complete_batch(user_id, batch.items, db)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 from uuid import UUID
 from datetime import datetime
 import uuid
@@ -35,11 +35,15 @@ class Token(BaseModel):
 class ChatRequest(BaseModel):
     user_input: str
     additional_context: Optional[str] = None
+    stream: bool = False  # Reply as Server-Sent Events (chat.completion.chunk objects, then [DONE])
+    no_cache: bool = False  # Skip the response cache and always ask the model
+    session_id: Optional[str] = Field(None, max_length=64)  # Chats with the same id share their history
     class Config:
         schema_extra = {
             "example": {
                 "user_input": "What is an edge?",
-                "additional_context": "User is currently on the 'What is a graph?' Lesson in the 'Introduction to Graphs' unit."
+                "additional_context": "User is currently on the 'What is a graph?' Lesson in the 'Introduction to Graphs' unit.",
+                "session_id": "9b2f6c1e-lesson-1"
             }
         }
 
@@ -53,6 +57,13 @@ class LessonOut(BaseModel):
     class Config:
         orm_mode = True
 
+class LessonSummaryOut(BaseModel):
+    id: UUID
+    title: str
+    unit_id: UUID
+    class Config:
+        orm_mode = True
+
 # --- Practice Problem Schemas ---
 class PracticeProblemOut(BaseModel):
     id: UUID
@@ -63,6 +74,13 @@ class PracticeProblemOut(BaseModel):
     class Config:
         orm_mode = True
 
+class PracticeProblemSummaryOut(BaseModel):
+    id: UUID
+    type: str
+    unit_id: UUID
+    class Config:
+        orm_mode = True
+
 class PracticeProblemCreate(BaseModel):
     type: str
     question: str
@@ -85,6 +103,17 @@ class UnitOut(BaseModel):
     class Config:
         orm_mode = True
 
+# Same tree as UnitOut without lesson content and problem data
+class UnitSummaryOut(BaseModel):
+    id: UUID
+    name: str
+    course_id: UUID
+    order: int
+    lesson: LessonSummaryOut
+    practice_problems: List[PracticeProblemSummaryOut] = []
+    class Config:
+        orm_mode = True
+
 class UnitUpdate(BaseModel):
     name: Optional[str] = None
     order: Optional[int] = Field(None, ge=1)  # Order starts at 1
@@ -101,12 +130,34 @@ class CourseOut(BaseModel):
     units: List[UnitOut] = []
     class Config:
         orm_mode = True
+
+class CourseSummaryOut(BaseModel):
+    id: UUID
+    name: str
+    description: Optional[str]
+    units: List[UnitSummaryOut] = []
+    class Config:
+        orm_mode = True
         
 class LessonCreate(BaseModel):
     title: str
     content: str
     unit_id: UUID
 
+# --- Batch Reads ---
+# items follow the order of the requested ids, missing lists ids that matched nothing
+class LessonBatchOut(BaseModel):
+    items: List[LessonOut]
+    missing: List[str] = []
+
+class PracticeProblemBatchOut(BaseModel):
+    items: List[PracticeProblemOut]
+    missing: List[str] = []
+
+class UnitBatchOut(BaseModel):
+    items: List[UnitOut]
+    missing: List[str] = []
+
 # --- Skill Schemas ---
 class SkillOut(BaseModel):
     id: UUID
@@ -133,6 +184,23 @@ class UserUnitProgressOut(BaseModel):
     class Config:
         orm_mode = True
 
+# --- Course Dashboard ---
+class DashboardUnitOut(BaseModel):
+    unit_id: UUID
+    name: str
+    order: int
+    completion_percentage: float
+    unlocked: bool
+
+class CourseDashboardOut(BaseModel):
+    user_id: UUID
+    course_id: UUID
+    current_order: int
+    units: List[DashboardUnitOut]
+    completed_lesson_ids: List[UUID]
+    completed_problem_ids: List[UUID]
+    skills: List[UserSkillOut]
+
 class UserUnitProgressUpdate(BaseModel):
     completion_percentage: float
     last_updated: Optional[datetime] = None
@@ -153,6 +221,25 @@ class UserProblemCompletion(BaseModel):
     class Config:
         orm_mode = True 
 
+# --- Batch Completions ---
+class CompletionItemIn(BaseModel):
+    type: Literal["lesson", "practice_problem"]
+    id: UUID
+
+class CompletionBatchIn(BaseModel):
+    items: List[CompletionItemIn]  # Applied in this order
+
+class CompletionItemResult(BaseModel):
+    type: str
+    id: UUID
+    status: str  # "completed", "already_completed", "not_found" or "locked"
+    detail: Optional[str] = None
+    completed_at: Optional[datetime] = None
+
+class CompletionBatchOut(BaseModel):
+    user_id: UUID
+    results: List[CompletionItemResult]
+
 class UserCompletions(BaseModel):
     user_id: UUID
     lessons: List[UserLessonCompletion]
@@ -1,7 +1,8 @@
-from models.models import Course, Unit, Lesson, PracticeProblem, Skill, User
+from models.models import Course, Unit, Lesson, PracticeProblem, Skill, User, UserUnitProgress
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from helpers.authHelpers import get_password_hash
+from helpers.authHelpers import get_password_hash, principal_cache
+from helpers.cacheHelpers import bump_content_version, learning_context_cache
 from pathlib import Path
 
 
@@ -11,6 +12,8 @@ def reset_and_seed_database(db: Session):
     db.execute(text("DELETE FROM problem_skills"))
     db.execute(text("DELETE FROM user_skills"))
     
+    db.query(UserUnitProgress).delete()
+
     # Then delete from main tables
     db.query(Skill).delete()
     db.query(PracticeProblem).delete()
@@ -186,6 +189,11 @@ def reset_and_seed_database(db: Session):
             db.add(p)
         db.commit()
 
+    # Only reaches the caches of this process; a running server picks the new content
+    # up as its cache entries expire (CATALOG_CACHE_TTL_SECONDS and friends)
+    bump_content_version()
+    principal_cache.clear()
+    learning_context_cache.clear()
     print("Dijkstra course, units, lessons, and practice problems created from markdown files.")
 
 if __name__ == "__main__":
@@ -1,109 +1,437 @@
 import os
+import re
+import asyncio
+import anyio
+import json
+import time
+import hashlib
 import httpx
+from collections import deque
 from fastapi import HTTPException
-from profanity_check import predict
+from fastapi.responses import StreamingResponse
 from schemas.schemas import ChatRequest
-from models.models import User, PromptLog
+from models.models import User
 from datetime import datetime, timedelta, timezone
-from helpers.skillHelpers import get_user_learning_levels
+from helpers.skillHelpers import get_user_learning_levels_async
+from helpers.cacheHelpers import LRUCache, cached_learning_context, cache_learning_context
+from helpers.profanityHelpers import is_profane
+from services import conversationService, promptLogService
+from services.conversationService import estimate_tokens
+from db.db import AsyncSessionLocal
+from sqlalchemy import case, func, or_, update
 
 DAILY_LIMIT = 10_000
+CHAT_MAX_TOKENS = 1000
+QUOTA_LEDGER_SIZE = int(os.getenv("QUOTA_LEDGER_SIZE") or 4096)  # users
 INFERENCE_URL     = os.getenv("INFERENCE_URL")
 INFERENCE_KEY     = os.getenv("INFERENCE_KEY")
 INFERENCE_MODEL_ID = os.getenv("INFERENCE_MODEL_ID")
 
+# Connection pool to the inference backend
+INFERENCE_MAX_CONNECTIONS = int(os.getenv("INFERENCE_MAX_CONNECTIONS") or 20)
+INFERENCE_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("INFERENCE_MAX_KEEPALIVE_CONNECTIONS") or 10)
+INFERENCE_KEEPALIVE_EXPIRY = float(os.getenv("INFERENCE_KEEPALIVE_EXPIRY") or 30)
+INFERENCE_CONNECT_TIMEOUT = float(os.getenv("INFERENCE_CONNECT_TIMEOUT") or 5)
+INFERENCE_READ_TIMEOUT = float(os.getenv("INFERENCE_READ_TIMEOUT") or 30)
+INFERENCE_POOL_TIMEOUT = float(os.getenv("INFERENCE_POOL_TIMEOUT") or 5)
+# Needs the optional h2 package (pip install "httpx[http2]")
+INFERENCE_HTTP2 = (os.getenv("INFERENCE_HTTP2") or "").lower() in ("1", "true", "yes")
+
+# Response cache for repeated tutor prompts
+AI_RESPONSE_CACHE_SIZE = int(os.getenv("AI_RESPONSE_CACHE_SIZE") or 1024)
+AI_RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("AI_RESPONSE_CACHE_TTL_SECONDS") or 3600)
+AI_LEVEL_BUCKETS = int(os.getenv("AI_LEVEL_BUCKETS") or 4)  # learning levels are rounded down to quarters
+
 SYSTEM_PROMPT_BASE = (
     "You are an intelligent AI tutor called Vertex0 on a platform called DijkstraVerse that helps users learn graph algorithms. "
     "Provide step-by-step explanations, avoid giving direct answers, and tailor your help "
     "to the user's current skill level."
 )
 
+# --- Shared HTTP client ---
+# One client per process, opened and closed by the app lifespan (see main.py), so
+# chats reuse keep-alive connections instead of paying a TCP+TLS handshake each.
+_http_client: httpx.AsyncClient = None
+_http_client_http2 = False  # what the client was actually built with, INFERENCE_HTTP2 may have fallen back
+
+def create_http_client():
+    global _http_client_http2
+    http2 = INFERENCE_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("INFERENCE_HTTP2 is set but h2 is not installed, falling back to HTTP/1.1")
+            http2 = False
+    _http_client_http2 = http2
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=INFERENCE_MAX_CONNECTIONS,
+            max_keepalive_connections=INFERENCE_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=INFERENCE_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=INFERENCE_CONNECT_TIMEOUT,
+            read=INFERENCE_READ_TIMEOUT,
+            write=INFERENCE_CONNECT_TIMEOUT,
+            pool=INFERENCE_POOL_TIMEOUT,
+        ),
+    )
+
+async def start_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = create_http_client()
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def get_http_client():
+    # Created lazily when the app runs without its lifespan (e.g. in a shell)
+    global _http_client
+    if _http_client is None:
+        _http_client = create_http_client()
+    return _http_client
+
+def http_pool_stats():
+    if _http_client is None:
+        return {"open": False}
+    stats = {
+        "open": True,
+        "http2": _http_client_http2,
+        "max_connections": INFERENCE_MAX_CONNECTIONS,
+        "max_keepalive_connections": INFERENCE_MAX_KEEPALIVE_CONNECTIONS,
+    }
+    # httpx doesn't expose pool stats, read them from the underlying httpcore pool. Those
+    # are private, so another httpx/httpcore version (or a mock transport) reports None.
+    pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    requests = getattr(pool, "_requests", None)
+    if connections is None:
+        return {**stats, "connections": None, "active": None, "idle": None, "requests": None}
+    connections = list(connections)
+    try:
+        idle = sum(1 for connection in connections if connection.is_idle())
+    except AttributeError:
+        idle = None
+    return {
+        **stats,
+        "connections": len(connections),
+        "active": len(connections) - idle if idle is not None else None,
+        "idle": idle,
+        "requests": len(requests) if requests is not None else None,
+    }
+
+# --- Response cache ---
+# Replies to the same question, with the same context, for learners at about the same
+# levels. Keys are built by response_cache_key; replies that depend on the previous
+# exchange are never cached.
+response_cache = LRUCache(AI_RESPONSE_CACHE_SIZE, ttl=AI_RESPONSE_CACHE_TTL_SECONDS)
+_response_cache_bypassed = 0
+
+def normalize_prompt(text: str):
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+def bucket_learning_levels(learning_levels: dict):
+    return sorted(
+        (name, min(int(level * AI_LEVEL_BUCKETS), AI_LEVEL_BUCKETS - 1))
+        for name, level in learning_levels.items()
+    )
+
+def response_cache_key(req: ChatRequest, learning_levels: dict):
+    key = json.dumps([
+        INFERENCE_MODEL_ID,
+        normalize_prompt(req.user_input),
+        normalize_prompt(req.additional_context),
+        bucket_learning_levels(learning_levels),
+    ])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def response_cache_stats():
+    return {**response_cache.stats(), "bypassed": _response_cache_bypassed}
+
+# --- Single-flight ---
+# Identical requests (same model, system prompt and messages) in flight at the same
+# time share one upstream call; each caller still records its own tokens and PromptLog.
+_inflight = {}  # payload hash -> asyncio.Task
+_coalesced_requests = 0
+
+def single_flight_stats():
+    return {"in_flight": len(_inflight), "coalesced": _coalesced_requests}
+
+async def fetch_completion(payload: dict, headers: dict):
+    try:
+        resp = await get_http_client().post(f"{INFERENCE_URL}/v1/chat/completions", json=payload, headers=headers)
+    except httpx.ReadTimeout:
+        raise HTTPException(504, f"AI service took too long (More than {INFERENCE_READ_TIMEOUT:g} seconds) please simplify your request or try again later.")
+    except httpx.PoolTimeout:
+        raise HTTPException(503, "AI service is busy, please try again later.")
+    except httpx.RequestError as e:
+        raise HTTPException(500, f"AI service request error: {e}")
+
+    if resp.status_code != 200:
+        raise HTTPException(resp.status_code, f"AI error: {resp.text}")
+    return resp.json()
+
+def _forget_inflight(key: str, task: asyncio.Task):
+    _inflight.pop(key, None)
+    # Mark the error as retrieved even if every waiter has gone away
+    if not task.cancelled():
+        task.exception()
+
+async def coalesced_completion(payload: dict, headers: dict):
+    """The backend's chat completion for payload, sharing the call with identical requests in flight."""
+    global _coalesced_requests
+    key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(fetch_completion(payload, headers))
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _forget_inflight(key, done))
+    else:
+        _coalesced_requests += 1
+    # A caller that disconnects must not cancel the call for the others
+    return await asyncio.shield(task)
+
+# --- Streaming ---
+# Time to first token of recent streamed chats, in milliseconds
+_ttft_samples = deque(maxlen=500)
+
+def streaming_stats():
+    samples = sorted(_ttft_samples)
+    if not samples:
+        return {"streams": 0}
+    return {
+        "streams": len(samples),
+        "ttft_ms_p50": samples[len(samples) // 2],
+        "ttft_ms_p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+def sse_event(data: str, event: str = None):
+    return (f"event: {event}\n" if event else "") + f"data: {data}\n\n"
+
+def single_reply_stream(reply: str):
+    """A complete reply sent as one chat.completion.chunk, for replies that don't come from the model."""
+    async def events():
+        chunk = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": reply}, "finish_reason": "stop"}]}
+        yield sse_event(json.dumps(chunk))
+        yield sse_event("[DONE]")
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def stream_response(req: ChatRequest, payload: dict, headers: dict, user: User, started_at: float, cache_key: str = None):
+    """
+    Forward the backend's streamed chat completion chunks to the client as Server-Sent Events.
+
+    Token usage and the PromptLog are written once the stream ends, with a session of
+    their own since the request's session is closed by then. A client that goes away
+    cancels the stream, so that accounting runs shielded from the cancellation and is
+    charged for what was generated so far. Usage is requested from the backend
+    (stream_options.include_usage) and only estimated when it doesn't report it.
+    Replies that finish normally are added to the conversation, and stored in the
+    response cache under cache_key.
+    A final "metrics" event reports time to first token and the tokens counted.
+    """
+    async def events():
+        reply_parts = []
+        total_tokens = None
+        ttft_ms = None
+        finished = False
+        try:
+            async with get_http_client().stream(
+                "POST", f"{INFERENCE_URL}/v1/chat/completions",
+                json={**payload, "stream": True, "stream_options": {"include_usage": True}}, headers=headers
+            ) as resp:
+                if resp.status_code != 200:
+                    error = (await resp.aread()).decode(errors="replace")
+                    yield sse_event(json.dumps({"status": resp.status_code, "detail": f"AI error: {error}"}), event="error")
+                    return
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        finished = True
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        total_tokens = chunk["usage"].get("total_tokens")
+                    for choice in chunk.get("choices", []):
+                        content = (choice.get("delta") or {}).get("content")
+                        if content:
+                            if ttft_ms is None:
+                                ttft_ms = round((time.perf_counter() - started_at) * 1000, 1)
+                                _ttft_samples.append(ttft_ms)
+                            reply_parts.append(content)
+                    yield sse_event(data)
+        except httpx.ReadTimeout:
+            yield sse_event(json.dumps({"status": 504, "detail": "AI service took too long, please try again later."}), event="error")
+            return
+        except httpx.RequestError as e:
+            yield sse_event(json.dumps({"status": 500, "detail": f"AI service request error: {e}"}), event="error")
+            return
+        finally:
+            if reply_parts:
+                reply = "".join(reply_parts)
+                if total_tokens is None:
+                    prompt = "".join(message["content"] for message in payload["messages"])
+                    total_tokens = estimate_tokens(prompt) + estimate_tokens(reply)
+                with anyio.CancelScope(shield=True):
+                    async with AsyncSessionLocal() as db:
+                        await record_chat(user, req.user_input, reply, total_tokens, db)
+                if finished:
+                    conversationService.record_turn(user.id, req.session_id, req.user_input, reply)
+                    if cache_key is not None:
+                        response_cache.set(cache_key, reply)
+
+        yield sse_event(json.dumps({"ttft_ms": ttft_ms, "total_tokens": total_tokens}), event="metrics")
+        yield sse_event("[DONE]")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def get_learning_context(user: User, db):
+    """The user's learning levels and the system prompt sentence describing them, cached per user."""
+    context = cached_learning_context(user.id)
+    if context is None:
+        learning_levels = (await get_user_learning_levels_async(str(user.id), db))["Learning Levels"]
+        context = (
+            learning_levels,
+            f"Here is the user's current Learning levels, they range from 0 to 1, 0 is Beginner, 1 is master, if it's empty then the user hasn't started a course: {learning_levels}.",
+        )
+        cache_learning_context(user.id, context)
+    return context
+
 async def get_response(req: ChatRequest, db, user: User):
-    if not quota_ok(user, db):
-        raise HTTPException(429, "Daily token limit reached.")
-    
+    global _response_cache_bypassed
+    started_at = time.perf_counter()
     if not all([INFERENCE_URL, INFERENCE_KEY, INFERENCE_MODEL_ID]):
         raise HTTPException(500, "AI service not configured")
     
-    if predict([req.user_input])[0] == 1:
-        return {"reply": "Hey, I'd love to help you, but I can't assist with that kind of content. Please ask me something else."}
+    if await is_profane(req.user_input):
+        refusal = "Hey, I'd love to help you, but I can't assist with that kind of content. Please ask me something else."
+        return single_reply_stream(refusal) if req.stream else {"reply": refusal}
+
+    learning_levels, learning_context = await get_learning_context(user, db)
+
+    if req.session_id is not None:
+        # The session's recent turns, within the token budget, after a summary of older ones
+        history = conversationService.history_messages(user.id, req.session_id)
+    elif req.additional_context is not None and "multiple_choice question incorrectly. Here are the details" in req.additional_context:
+        # Without a session, only the follow-up to a wrong answer gets the previous exchange
+        history = conversationService.history_messages(user.id, last_turns=1)
+    else:
+        history = []
 
-    user_ctx = get_user_learning_levels(str(user.id), db)
+    # Replies that depend on earlier turns aren't cached
+    cache_key = None
+    if req.no_cache:
+        _response_cache_bypassed += 1
+    elif not history:
+        cache_key = response_cache_key(req, learning_levels)
+        cached_reply = response_cache.get(cache_key)
+        if cached_reply is not None:
+            # Served without the model, so it doesn't count against the daily quota
+            promptLogService.log_prompt(user.id, req.user_input, cached_reply, 0)
+            conversationService.record_turn(user.id, req.session_id, req.user_input, cached_reply)
+            return single_reply_stream(cached_reply) if req.stream else {"reply": cached_reply}
+
+    quota_ok(user)
     
     system_prompt = (
-        f"{SYSTEM_PROMPT_BASE} "
-        f"Here is the user's current Learning levels, they range from 0 to 1, 0 is Beginner, 1 is master, if it's empty then the user hasn't started a course: {user_ctx['Learning Levels']}."
+        f"{SYSTEM_PROMPT_BASE} {learning_context}"
         + (f" Additional context: {req.additional_context}" if req.additional_context is not None else "")
     )
-    # Start with system message
-    messages = [{"role": "system", "content": system_prompt}]
-    
-    last_log = None
-    if req.additional_context is not None and "multiple_choice question incorrectly. Here are the details" in req.additional_context:    
-        # Get the last message exchange for this user
-        last_log = db.query(PromptLog).filter(
-            PromptLog.user_id == user.id
-        ).order_by(PromptLog.timestamp.desc()).first()
-        
-    # Include last exchange if it exists
-    if last_log:
-            messages.append({"role": "user", "content": last_log.user_prompt})
-            messages.append({"role": "assistant", "content": last_log.llm_response})
-        
+    # Start with system message, then the earlier turns
+    messages = [{"role": "system", "content": system_prompt}, *history]
+
     # Add current user message
     messages.append({"role": "user", "content": req.user_input})
 
     payload = {
         "model": INFERENCE_MODEL_ID,
         "messages": messages,
-        "max_tokens": 1000,
+        "max_tokens": CHAT_MAX_TOKENS,
     }
+    check_quota_preflight(user, payload)
 
     headers = {
         "Authorization": f"Bearer {INFERENCE_KEY}",
         "Content-Type": "application/json"
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(f"{INFERENCE_URL}/v1/chat/completions", json=payload, headers=headers, timeout=30)
-        except httpx.ReadTimeout:
-            raise HTTPException(504, "AI service took too long (More than 30 seconds) please simplify your request or try again later.")
-        except httpx.RequestError as e:
-            raise HTTPException(500, f"AI service request error: {e}")
+    if req.stream:
+        return stream_response(req, payload, headers, user, started_at, cache_key)
 
-    if resp.status_code != 200:
-        raise HTTPException(resp.status_code, f"AI error: {resp.text}")
-    
-    data = resp.json()
-    total_tokens = data["usage"]["total_tokens"]
-    update_user_tokens_used(user, total_tokens, db)
-    
-    # Log the prompt
-    prompt_log = PromptLog(
-        user_id=user.id,
-        user_prompt=req.user_input,  # Store just the user input
-        llm_response=data["choices"][0]["message"]["content"],
-        tokens_used=total_tokens,
-    )
-    db.add(prompt_log)
-    db.commit()
-    return {"reply": data["choices"][0]["message"]["content"]}
-
-
-def update_user_tokens_used(user: User, tokens: int, db):
-    user.tokens_used += tokens
-    db.commit()
-
-def quota_ok(user: User, db):
-    # Ensure last_reset is timezone-aware
-    last_reset = user.last_reset
-    if last_reset.tzinfo is None:
-        last_reset = last_reset.replace(tzinfo=timezone.utc)
-    if datetime.now(timezone.utc) - last_reset > timedelta(days=1):
-        user.tokens_used = 0
-        user.last_reset = datetime.now(timezone.utc)
-        db.commit()
-    if user.tokens_used >= DAILY_LIMIT:
+    data = await coalesced_completion(payload, headers)
+    reply = data["choices"][0]["message"]["content"]
+    await record_chat(user, req.user_input, reply, data["usage"]["total_tokens"], db)
+    conversationService.record_turn(user.id, req.session_id, req.user_input, reply)
+    if cache_key is not None:
+        response_cache.set(cache_key, reply)
+    return {"reply": reply}
+
+async def record_chat(user: User, user_input: str, reply: str, total_tokens: int, db):
+    await update_user_tokens_used(user, total_tokens, db)
+    await db.commit()
+    # Store just the user input; the row is written in the background
+    promptLogService.log_prompt(user.id, user_input, reply, total_tokens)
+
+
+# --- Quota ledger ---
+# Usage is charged with one UPDATE that also starts a new day when the last reset is
+# more than a day old, so concurrent chats can't lose increments. The values it
+# returns are kept per process, and quota checks read them without touching the DB.
+# Other processes' charges show up at this process's next charge, or when the
+# principal snapshot is reloaded.
+quota_ledger = LRUCache(QUOTA_LEDGER_SIZE)  # user id -> (tokens_used, last_reset)
+
+def _as_utc(value: datetime):
+    # SQLite hands back naive datetimes
+    return value.replace(tzinfo=timezone.utc) if value is not None and value.tzinfo is None else value
+
+def tokens_remaining(user: User):
+    """Tokens the user has left today, from the ledger (or the user snapshot before their first charge)."""
+    tokens_used, last_reset = quota_ledger.get(str(user.id), (user.tokens_used or 0, user.last_reset))
+    last_reset = _as_utc(last_reset)
+    if last_reset is None or datetime.now(timezone.utc) - last_reset > timedelta(days=1):
+        tokens_used = 0  # a new day, reset in the database by the next charge
+    return DAILY_LIMIT - tokens_used
+
+def quota_ok(user: User):
+    if tokens_remaining(user) <= 0:
         raise HTTPException(429, "Daily token limit reached.")
     return user
+
+def check_quota_preflight(user: User, payload: dict):
+    """Reject a chat whose prompt plus max_tokens could take the user past DAILY_LIMIT."""
+    prompt = "".join(message["content"] for message in payload["messages"])
+    if estimate_tokens(prompt) + payload["max_tokens"] > tokens_remaining(user):
+        raise HTTPException(429, "Not enough tokens left today for this request, please try a shorter question or come back tomorrow.")
+
+# The user comes from the principal cache and is detached: the charged values are
+# mirrored on the cached snapshot
+async def update_user_tokens_used(user: User, tokens: int, db):
+    """Charge tokens in the caller's transaction, starting a new day if the last reset has expired."""
+    now = datetime.now(timezone.utc)
+    expired = or_(User.last_reset.is_(None), User.last_reset < now - timedelta(days=1))
+    stmt = (
+        update(User)
+        .where(User.id == user.id)
+        .values(
+            tokens_used=case((expired, tokens), else_=func.coalesce(User.tokens_used, 0) + tokens),
+            last_reset=case((expired, now), else_=User.last_reset),
+        )
+        .returning(User.tokens_used, User.last_reset)
+        .execution_options(synchronize_session=False)
+    )
+    tokens_used, last_reset = (await db.execute(stmt)).one()
+    quota_ledger.set(str(user.id), (tokens_used, last_reset))
+    user.tokens_used = tokens_used
+    user.last_reset = last_reset
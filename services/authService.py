@@ -1,15 +1,16 @@
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from models import models
 from schemas import schemas 
 from helpers import authHelpers
 
-def register_user(user: schemas.UserCreate, db: Session):
-    existing = db.query(models.User).filter(models.User.email == user.email).first()
+async def register_user(user: schemas.UserCreate, db: AsyncSession):
+    existing = (await db.execute(select(models.User).where(models.User.email == user.email))).scalars().first()
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = authHelpers.get_password_hash(user.password)
+    hashed_password = await authHelpers.get_password_hash_async(user.password)
     new_user = models.User(
         firstname=user.firstname,
         lastname=user.lastname,
@@ -17,13 +18,13 @@ def register_user(user: schemas.UserCreate, db: Session):
         hashed_password=hashed_password
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
-def login_user(form_data: schemas.UserLogin, db: Session):
-    user = db.query(models.User).filter(models.User.email == form_data.email).first()
-    if not user or not authHelpers.verify_password(form_data.password, user.hashed_password):
+async def login_user(form_data: schemas.UserLogin, db: AsyncSession):
+    user = (await db.execute(select(models.User).where(models.User.email == form_data.email))).scalars().first()
+    if not user or not await authHelpers.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
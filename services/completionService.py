@@ -0,0 +1,176 @@
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from typing import List
+import uuid
+
+from models.models import (
+    Lesson, PracticeProblem, Unit, User, UserCourseOrderProgress,
+    UserLessonCompletion, UserProblemCompletion, UserUnitProgress,
+    lesson_skills, problem_skills,
+)
+from schemas import schemas
+from helpers.skillHelpers import upsert_skill_gains
+from helpers.progressHelpers import record_unit_part_completed, unlock_next_unit
+from helpers.cacheHelpers import invalidate_learning_context, invalidate_user_dashboards
+from db.db import dialect_insert
+
+MAX_BATCH_COMPLETIONS = 100
+
+def complete_batch(user_id: uuid.UUID, items: List[schemas.CompletionItemIn], db: Session):
+    """
+    Apply an ordered list of lesson and problem completions in one transaction.
+
+    Everything needed to validate the batch is loaded up front with a fixed number of
+    IN queries, the unlock order is then replayed in memory item by item (an item can
+    unlock the unit of the next one), and the accepted completions are written in bulk.
+    Items that can't be applied are reported and skipped, they don't fail the batch.
+    """
+    if len(items) > MAX_BATCH_COMPLETIONS:
+        raise HTTPException(400, f"At most {MAX_BATCH_COMPLETIONS} completions can be sent at once")
+
+    lesson_ids = {item.id for item in items if item.type == "lesson"}
+    problem_ids = {item.id for item in items if item.type == "practice_problem"}
+
+    # --- Load ---
+    # Checked up front so an unknown user is a 404, not a foreign key failure reported as a conflict below
+    if db.query(User.id).filter(User.id == user_id).first() is None:
+        raise HTTPException(404, "User not found")
+
+    part_units = {}  # (type, part id) -> unit id
+    if lesson_ids:
+        part_units.update(
+            (("lesson", lesson_id), unit_id)
+            for lesson_id, unit_id in db.query(Lesson.id, Lesson.unit_id).filter(Lesson.id.in_(lesson_ids))
+        )
+    if problem_ids:
+        part_units.update(
+            (("practice_problem", problem_id), unit_id)
+            for problem_id, unit_id in db.query(PracticeProblem.id, PracticeProblem.unit_id).filter(PracticeProblem.id.in_(problem_ids))
+        )
+    unit_ids = set(part_units.values())
+    units = {
+        unit.id: unit
+        for unit in db.query(Unit.id, Unit.course_id, Unit.order).filter(Unit.id.in_(unit_ids))
+    } if unit_ids else {}
+
+    completed = set()  # (type, part id)
+    if lesson_ids:
+        completed.update(
+            ("lesson", lesson_id)
+            for (lesson_id,) in db.query(UserLessonCompletion.lesson_id).filter(
+                UserLessonCompletion.user_id == user_id,
+                UserLessonCompletion.lesson_id.in_(lesson_ids)
+            )
+        )
+    if problem_ids:
+        completed.update(
+            ("practice_problem", problem_id)
+            for (problem_id,) in db.query(UserProblemCompletion.problem_id).filter(
+                UserProblemCompletion.user_id == user_id,
+                UserProblemCompletion.problem_id.in_(problem_ids)
+            )
+        )
+
+    # Snapshots for the replay only, the counters are written with atomic upserts below
+    course_ids = {unit.course_id for unit in units.values()}
+    current_orders = dict(
+        db.query(UserCourseOrderProgress.course_id, UserCourseOrderProgress.current_order).filter(
+            UserCourseOrderProgress.user_id == user_id,
+            UserCourseOrderProgress.course_id.in_(course_ids)
+        )
+    ) if course_ids else {}
+
+    completed_parts = dict(
+        db.query(UserUnitProgress.unit_id, UserUnitProgress.completed_parts).filter(
+            UserUnitProgress.user_id == user_id,
+            UserUnitProgress.unit_id.in_(unit_ids)
+        )
+    ) if unit_ids else {}
+    # Units always have only one lesson
+    problem_counts = dict(
+        db.query(PracticeProblem.unit_id, func.count(PracticeProblem.id))
+        .filter(PracticeProblem.unit_id.in_(unit_ids))
+        .group_by(PracticeProblem.unit_id)
+    ) if unit_ids else {}
+
+    # --- Replay in order ---
+    now = datetime.now(timezone.utc)
+    results = []
+    new_lessons, new_problems = [], []
+    unit_parts = {}  # unit id -> parts completed by the batch, in order of first completion
+    finished_on_problem = {}  # unit id -> whether the batch's last part in the unit is a problem
+    for item in items:
+        key = (item.type, item.id)
+        unit = units.get(part_units.get(key))
+        result = {"type": item.type, "id": item.id}
+        if unit is None:
+            results.append({**result, "status": "not_found", "detail": "Lesson or problem not found"})
+            continue
+        if key in completed:
+            results.append({**result, "status": "already_completed", "detail": "Already completed"})
+            continue
+
+        if current_orders.get(unit.course_id, 1) != unit.order:
+            results.append({**result, "status": "locked", "detail": "This unit is either finished or not unlocked yet"})
+            continue
+
+        completed.add(key)
+        completion = {"id": uuid.uuid4(), "user_id": user_id, "completed_at": now}
+        if item.type == "lesson":
+            new_lessons.append({**completion, "lesson_id": item.id})
+        else:
+            new_problems.append({**completion, "problem_id": item.id})
+
+        unit_parts[unit.id] = unit_parts.get(unit.id, 0) + 1
+        finished_on_problem[unit.id] = item.type == "practice_problem"
+        completed_parts[unit.id] = completed_parts.get(unit.id, 0) + 1
+
+        # Same rule as complete_problem: finishing the unit on a problem unlocks the next one
+        if item.type == "practice_problem" and completed_parts[unit.id] >= 1 + problem_counts.get(unit.id, 0):
+            current_orders[unit.course_id] = unit.order + 1
+
+        results.append({**result, "status": "completed", "completed_at": now})
+
+    # --- Write ---
+    # A completion written by a concurrent request since the load would make the replay
+    # above wrong, so any conflict aborts the batch and the client retries. Progress
+    # counters go through the same upserts as single completions, so concurrent
+    # completions of other parts of a unit add up instead of being overwritten.
+    try:
+        inserted = True
+        if new_lessons:
+            inserted &= insert_completions(db, UserLessonCompletion, UserLessonCompletion.lesson_id, new_lessons)
+            upsert_skill_gains(db, user_id, lesson_skills, lesson_skills.c.lesson_id, [c["lesson_id"] for c in new_lessons])
+        if new_problems:
+            inserted &= insert_completions(db, UserProblemCompletion, UserProblemCompletion.problem_id, new_problems)
+            upsert_skill_gains(db, user_id, problem_skills, problem_skills.c.problem_id, [c["problem_id"] for c in new_problems])
+        for unit_id, parts in unit_parts.items():
+            progress = record_unit_part_completed(db, user_id, unit_id, parts)
+            if finished_on_problem[unit_id] and progress.completed_parts >= progress.total_parts:
+                unit = units[unit_id]
+                unlock_next_unit(db, user_id, unit.course_id, unit.order)
+        if inserted:
+            db.commit()
+            invalidate_user_dashboards(user_id)
+            invalidate_learning_context(user_id)
+    except IntegrityError:
+        inserted = False
+    if not inserted:
+        db.rollback()
+        raise HTTPException(409, "Completions changed while the batch was applied, please retry")
+
+    return {"user_id": user_id, "results": results}
+
+
+def insert_completions(db: Session, model, part_column, rows: List[dict]):
+    """Bulk insert completions, returns False if any of them already existed."""
+    stmt = (
+        dialect_insert(db, model)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[model.user_id, part_column])
+        .returning(model.id)
+    )
+    return len(db.execute(stmt).all()) == len(rows)
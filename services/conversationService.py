@@ -0,0 +1,98 @@
+from collections import deque
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+import os
+import textwrap
+
+from helpers.cacheHelpers import LRUCache
+
+load_dotenv()
+
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE") or 10_000)  # sessions
+CONVERSATION_TTL_SECONDS = int(os.getenv("CONVERSATION_TTL_SECONDS") or 3600)
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS") or 20)
+# Tokens of verbatim history sent with a chat; older turns are folded into the summary
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET") or 1500)
+CONVERSATION_SUMMARY_TOKEN_BUDGET = int(os.getenv("CONVERSATION_SUMMARY_TOKEN_BUDGET") or 300)
+SUMMARY_EXCERPT_CHARS = 160
+
+def estimate_tokens(text: str):
+    # Rough count (~4 characters per token) for when the backend doesn't report usage
+    return max(1, len(text) // 4)
+
+@dataclass
+class Turn:
+    user_input: str
+    reply: str
+    tokens: int
+
+@dataclass
+class Conversation:
+    """Recent turns of a chat session, and a rolling summary of the ones before them."""
+    turns: deque = field(default_factory=lambda: deque(maxlen=CONVERSATION_MAX_TURNS))
+    summary_lines: deque = field(default_factory=deque)
+    summary_tokens: int = 0
+    history_tokens: int = 0
+
+    def add_turn(self, user_input: str, reply: str):
+        if len(self.turns) == self.turns.maxlen:
+            self._summarize_oldest()
+        turn = Turn(user_input, reply, estimate_tokens(user_input) + estimate_tokens(reply))
+        self.turns.append(turn)
+        self.history_tokens += turn.tokens
+        # Keep at least the latest turn verbatim, however long it is
+        while self.history_tokens > CONVERSATION_TOKEN_BUDGET and len(self.turns) > 1:
+            self._summarize_oldest()
+
+    def _summarize_oldest(self):
+        # Extractive: the summary only costs tokens when it is sent, not a model call
+        turn = self.turns.popleft()
+        self.history_tokens -= turn.tokens
+        line = (
+            f"- The learner asked: {textwrap.shorten(turn.user_input, SUMMARY_EXCERPT_CHARS)} "
+            f"The tutor answered: {textwrap.shorten(turn.reply, SUMMARY_EXCERPT_CHARS)}"
+        )
+        self.summary_lines.append(line)
+        self.summary_tokens += estimate_tokens(line)
+        while self.summary_tokens > CONVERSATION_SUMMARY_TOKEN_BUDGET and len(self.summary_lines) > 1:
+            self.summary_tokens -= estimate_tokens(self.summary_lines.popleft())
+
+    def messages(self, last_turns: int = None):
+        """History as chat messages: the summary (as a system message) then the recent turns."""
+        turns = list(self.turns)
+        messages = []
+        if last_turns is not None:
+            turns = turns[-last_turns:] if last_turns else []
+        elif self.summary_lines:
+            messages.append({
+                "role": "system",
+                "content": "Summary of the earlier part of this conversation:\n" + "\n".join(self.summary_lines),
+            })
+        for turn in turns:
+            messages.append({"role": "user", "content": turn.user_input})
+            messages.append({"role": "assistant", "content": turn.reply})
+        return messages
+
+# --- Sessions ---
+# Kept per process, keyed by user and the client's session id so sessions can't be read
+# across users. Chats without a session id share one default conversation per user.
+conversation_cache = LRUCache(CONVERSATION_CACHE_SIZE, ttl=CONVERSATION_TTL_SECONDS)
+
+def _session_key(user_id, session_id: str = None):
+    return (str(user_id).lower(), session_id)
+
+def get_conversation(user_id, session_id: str = None):
+    return conversation_cache.get(_session_key(user_id, session_id))
+
+def history_messages(user_id, session_id: str = None, last_turns: int = None):
+    conversation = get_conversation(user_id, session_id)
+    return conversation.messages(last_turns) if conversation is not None else []
+
+def record_turn(user_id, session_id: str, user_input: str, reply: str):
+    key = _session_key(user_id, session_id)
+    conversation = conversation_cache.get(key)
+    if conversation is None:
+        conversation = Conversation()
+    conversation.add_turn(user_input, reply)
+    # Set again so the TTL counts from the latest turn
+    conversation_cache.set(key, conversation)
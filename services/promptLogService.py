@@ -0,0 +1,209 @@
+from dotenv import load_dotenv
+from datetime import datetime, timezone
+from sqlalchemy.exc import DataError, IntegrityError
+import asyncio
+import json
+import os
+import uuid
+
+from models.models import PromptLog
+from db.db import AsyncSessionLocal, dialect_insert
+
+load_dotenv()
+
+PROMPT_LOG_QUEUE_SIZE = int(os.getenv("PROMPT_LOG_QUEUE_SIZE") or 10_000)
+PROMPT_LOG_BATCH_SIZE = int(os.getenv("PROMPT_LOG_BATCH_SIZE") or 100)
+PROMPT_LOG_FLUSH_INTERVAL_MS = float(os.getenv("PROMPT_LOG_FLUSH_INTERVAL_MS") or 500)
+PROMPT_LOG_WRITE_TIMEOUT = float(os.getenv("PROMPT_LOG_WRITE_TIMEOUT") or 5)  # seconds
+# Rows that can't be queued or written in time are appended here, and loaded back on the next start
+# or once the writer has written a batch again.
+# Rows the database rejects (e.g. their user was deleted) can never be written and are dropped.
+PROMPT_LOG_SPILL_PATH = os.getenv("PROMPT_LOG_SPILL_PATH") or "prompt_logs.spill.jsonl"
+
+# --- Write-behind PromptLog writer ---
+# Chats queue their PromptLog rows and return; a background task started by the app
+# lifespan (see main.py) inserts them in batches of up to PROMPT_LOG_BATCH_SIZE rows,
+# or whatever arrived within PROMPT_LOG_FLUSH_INTERVAL_MS.
+_queue: asyncio.Queue = None
+_writer_task: asyncio.Task = None
+_collecting = []  # rows taken off the queue for the next batch
+_current_write: asyncio.Task = None
+_spill_pending = False  # rows were spilled since the spill file was last replayed
+_spill_tasks = set()  # spills started by log_prompt, kept referenced until they finish
+_stats = {"written": 0, "batches": 0, "spilled": 0, "dropped": 0, "replayed": 0}
+
+def prompt_log_stats():
+    return {
+        "running": _writer_task is not None,
+        "queue_depth": _queue.qsize() if _queue is not None else 0,
+        "queue_size": PROMPT_LOG_QUEUE_SIZE,
+        **_stats,
+    }
+
+def log_prompt(user_id, user_prompt: str, llm_response: str, tokens_used: int):
+    """Queue a PromptLog row; it is spilled to PROMPT_LOG_SPILL_PATH if the queue is full or not running."""
+    row = {
+        "id": uuid.uuid4(),
+        "user_id": user_id,
+        "user_prompt": user_prompt,
+        "llm_response": llm_response,
+        "tokens_used": tokens_used,
+        # Naive UTC: the column has no time zone
+        "timestamp": datetime.now(timezone.utc).replace(tzinfo=None),
+    }
+    if _queue is None:
+        _spill_in_background([row])
+        return
+    try:
+        _queue.put_nowait(row)
+    except asyncio.QueueFull:
+        _spill_in_background([row])
+
+def _spill_in_background(rows):
+    # File writes can block, keep them off the event loop
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _spill(rows)
+        return
+    task = loop.create_task(asyncio.to_thread(_spill, rows))
+    _spill_tasks.add(task)
+    task.add_done_callback(_spill_tasks.discard)
+
+async def start():
+    global _queue, _writer_task
+    _queue = asyncio.Queue(maxsize=PROMPT_LOG_QUEUE_SIZE)
+    await _replay_spilled()
+    _writer_task = asyncio.create_task(_run())
+
+async def stop():
+    """Stop the writer and flush everything still queued."""
+    global _queue, _writer_task
+    if _writer_task is None:
+        return
+    _writer_task.cancel()
+    try:
+        await _writer_task
+    except asyncio.CancelledError:
+        pass
+    if _current_write is not None:
+        await _current_write
+    if _spill_tasks:
+        await asyncio.gather(*_spill_tasks)
+
+    remaining = _collecting[:]
+    _collecting.clear()
+    while not _queue.empty():
+        remaining.append(_queue.get_nowait())
+    for start_at in range(0, len(remaining), PROMPT_LOG_BATCH_SIZE):
+        await _write(remaining[start_at:start_at + PROMPT_LOG_BATCH_SIZE])
+    _queue = None
+    _writer_task = None
+
+async def _run():
+    global _current_write
+    loop = asyncio.get_running_loop()
+    while True:
+        _collecting.append(await _queue.get())
+        deadline = loop.time() + PROMPT_LOG_FLUSH_INTERVAL_MS / 1000
+        while len(_collecting) < PROMPT_LOG_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                _collecting.append(await asyncio.wait_for(_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        batch = _collecting[:]
+        _collecting.clear()
+        # Shielded so stopping the writer doesn't abandon a batch halfway
+        _current_write = asyncio.ensure_future(_write(batch))
+        written = await asyncio.shield(_current_write)
+        _current_write = None
+        if written and _spill_pending:
+            # The database is taking writes again, retry what was spilled while it wasn't
+            await _replay_spilled()
+
+async def _write(batch):
+    """Write a batch, returns whether the database took it."""
+    try:
+        await asyncio.wait_for(_insert(batch), PROMPT_LOG_WRITE_TIMEOUT)
+    except (IntegrityError, DataError):
+        # A bad row fails the whole batch; write them one by one so it doesn't take the others with it
+        return await _write_rows(batch)
+    except Exception as e:
+        await _spill_async(batch, e)
+        return False
+    _stats["written"] += len(batch)
+    _stats["batches"] += 1
+    return True
+
+async def _write_rows(rows):
+    for index, row in enumerate(rows):
+        try:
+            await asyncio.wait_for(_insert([row]), PROMPT_LOG_WRITE_TIMEOUT)
+        except (IntegrityError, DataError) as e:
+            print(f"PromptLog writer: dropped row {row['id']}, the database rejected it: {e.orig!r}")
+            _stats["dropped"] += 1
+            continue
+        except Exception as e:
+            await _spill_async(rows[index:], e)
+            return False
+        _stats["written"] += 1
+    return True
+
+async def _insert(batch):
+    async with AsyncSessionLocal() as db:
+        # Rows can be written twice when a timed out batch had committed before it was spilled
+        stmt = dialect_insert(db, PromptLog).on_conflict_do_nothing(index_elements=[PromptLog.id])
+        await db.execute(stmt, batch)
+        await db.commit()
+
+async def _spill_async(rows, error: Exception):
+    print(f"PromptLog writer: could not write {len(rows)} rows ({error!r}), spilling them to {PROMPT_LOG_SPILL_PATH}")
+    await asyncio.to_thread(_spill, rows)
+
+def _spill(rows):
+    global _spill_pending
+    try:
+        with open(PROMPT_LOG_SPILL_PATH, "a", encoding="utf-8") as spill_file:
+            for row in rows:
+                spill_file.write(json.dumps(row, default=str) + "\n")
+    except OSError as e:
+        print(f"PromptLog writer: dropped {len(rows)} rows, could not spill them: {e}")
+        _stats["dropped"] += len(rows)
+        return
+    _stats["spilled"] += len(rows)
+    _spill_pending = True
+
+async def _replay_spilled():
+    # Queue spilled rows, they are written like any other
+    global _spill_pending
+    _spill_pending = False
+    rows = await asyncio.to_thread(_take_spilled)
+    for index, row in enumerate(rows):
+        try:
+            _queue.put_nowait(row)
+        except asyncio.QueueFull:
+            await asyncio.to_thread(_spill, rows[index:])
+            return
+        _stats["replayed"] += 1
+
+def _take_spilled():
+    if not os.path.exists(PROMPT_LOG_SPILL_PATH):
+        return []
+    # Moved aside first so rows spilled meanwhile go to a new file
+    replay_path = PROMPT_LOG_SPILL_PATH + ".replay"
+    os.replace(PROMPT_LOG_SPILL_PATH, replay_path)
+    rows = []
+    with open(replay_path, encoding="utf-8") as replay_file:
+        for line in replay_file:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            row["id"] = uuid.UUID(row["id"])
+            row["user_id"] = uuid.UUID(row["user_id"])
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+            rows.append(row)
+    os.remove(replay_path)
+    return rows
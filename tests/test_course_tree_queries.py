@@ -0,0 +1,65 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import pytest
+
+from db.db import Base
+from models.models import Course, Unit, Lesson, PracticeProblem
+from helpers.courseHelpers import query_course_tree, query_unit_tree
+
+PROBLEMS_PER_UNIT = 3
+
+def seeded_session(units: int):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    course = Course(name="Graphs", description="Graph algorithms")
+    for order in range(1, units + 1):
+        unit = Unit(name=f"Unit {order}", order=order, course=course)
+        unit.lesson = Lesson(title=f"Lesson {order}", content="...")
+        unit.practice_problems = [
+            PracticeProblem(type="multiple_choice", question=f"Question {order}.{i}")
+            for i in range(PROBLEMS_PER_UNIT)
+        ]
+        db.add(unit)
+    db.commit()
+    db.expunge_all()
+    return engine, db
+
+def count_queries(engine, load):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        load()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return len(statements)
+
+def walk_course_tree(db, summary):
+    for course in query_course_tree(db, summary=summary).all():
+        for unit in course.units:
+            unit.lesson.title
+            [problem.type for problem in unit.practice_problems]
+
+def walk_unit_tree(db):
+    for unit in query_unit_tree(db).all():
+        unit.lesson.title
+        [problem.type for problem in unit.practice_problems]
+
+@pytest.mark.parametrize("summary", [False, True])
+def test_course_tree_query_count_does_not_grow_with_units(summary):
+    counts = []
+    for units in (5, 10):
+        engine, db = seeded_session(units)
+        counts.append(count_queries(engine, lambda: walk_course_tree(db, summary)))
+        db.close()
+    assert counts[0] == counts[1] == 3
+
+def test_unit_tree_query_count_does_not_grow_with_units():
+    counts = []
+    for units in (5, 10):
+        engine, db = seeded_session(units)
+        counts.append(count_queries(engine, lambda: walk_unit_tree(db)))
+        db.close()
+    assert counts[0] == counts[1]
@@ -0,0 +1,54 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import pytest
+import uuid
+
+from db.db import Base
+from models.models import Skill, User, user_skills
+from helpers.skillHelpers import query_user_skills, user_skills_out
+
+def seeded_session(skills: int):
+    # The user has a learning level for every other skill
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = User(firstname="user1", lastname="lastName1", email="user1@user1.com", hashed_password="...")
+    db.add(user)
+    db.add_all([Skill(name=f"Skill {i}", description="...") for i in range(skills)])
+    db.flush()
+    started = db.query(Skill.id).order_by(Skill.name).all()[::2]
+    db.execute(user_skills.insert(), [
+        {"user_id": user.id, "skill_id": skill_id, "learning_level": 0.5} for (skill_id,) in started
+    ])
+    db.commit()
+    user_id = user.id
+    db.expunge_all()
+    return engine, db, user_id
+
+def count_queries(engine, load):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = load()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return len(statements), result
+
+@pytest.mark.parametrize("include_zero", [False, True])
+def test_user_skills_take_one_query_whatever_the_skill_count(include_zero):
+    for skills in (5, 50):
+        engine, db, user_id = seeded_session(skills)
+        count, out = count_queries(engine, lambda: user_skills_out(query_user_skills(db, user_id, include_zero).all()))
+        db.close()
+        assert count == 1
+        assert len(out) == (skills if include_zero else (skills + 1) // 2)
+        if include_zero:
+            assert sorted(skill["learning_level"] for skill in out)[0] == 0.0
+
+@pytest.mark.parametrize("include_zero", [False, True])
+def test_unknown_user_has_no_rows(include_zero):
+    engine, db, _ = seeded_session(5)
+    assert query_user_skills(db, uuid.uuid4(), include_zero).all() == []
+    db.close()